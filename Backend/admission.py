@@ -0,0 +1,88 @@
+# admission.py
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+
+class QueueFullError(Exception):
+    """처리 중인 요청과 대기열이 모두 차서 요청을 받을 수 없음 (retry_after초 뒤 재시도 권장)"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} 요청이 많아 처리할 수 없습니다. {retry_after}초 후 다시 시도하세요.")
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """엔드포인트별 동시 실행 수와 대기열 길이를 제한하는 입장 제어
+
+    reserve()로 자리를 예약한 요청만 slot()에서 실행 차례를 기다리며,
+    동시 실행 max_concurrent개와 대기 max_queue개가 모두 차면 즉시 QueueFullError를 낸다.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._semaphore = None
+        self.pending = 0  # 예약되어 아직 끝나지 않은 요청 (실행 중 + 대기 중)
+        self.running = 0
+        self.rejected = 0
+        self.completed = 0
+        self._mean_seconds = None  # 요청 처리 시간의 지수 이동 평균
+
+    def reserve(self):
+        if self.pending >= self.max_concurrent + self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(self.name, self.retry_after())
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+
+    def retry_after(self):
+        """대기열이 한 번 빠질 때까지 걸릴 것으로 예상되는 시간 (초, 최소 1)"""
+        mean_seconds = self._mean_seconds or 1.0
+        waves = (self.pending - self.max_concurrent) / self.max_concurrent + 1
+        return max(1, math.ceil(mean_seconds * max(waves, 1)))
+
+    @asynccontextmanager
+    async def slot(self):
+        """실행 차례를 기다렸다가 실행 중으로 표시 (reserve()로 예약한 요청만 사용)"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self._semaphore:
+            self.running += 1
+            started_at = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.running -= 1
+                self.completed += 1
+                elapsed = time.perf_counter() - started_at
+                self._mean_seconds = elapsed if self._mean_seconds is None else 0.8 * self._mean_seconds + 0.2 * elapsed
+
+    @asynccontextmanager
+    async def admit(self):
+        """예약부터 실행, 반납까지 한 번에 처리"""
+        self.reserve()
+        try:
+            async with self.slot():
+                yield
+        finally:
+            self.release()
+
+    def release_when_done(self, task):
+        """백그라운드 작업이 (시작 전에 취소되더라도) 끝나면 예약을 반납"""
+        task.add_done_callback(lambda _: self.release())
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "waiting": self.pending - self.running,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "mean_seconds": round(self._mean_seconds, 2) if self._mean_seconds is not None else None,
+        }
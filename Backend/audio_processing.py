@@ -0,0 +1,313 @@
+# audio_processing.py
+import hashlib
+import shutil
+import struct
+import subprocess
+import threading
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+SAMPLE_RATE = 16000  # Whisper 입력 샘플링 레이트
+FRAME_SECONDS = 0.02  # 에너지 계산 프레임 길이 (20ms)
+
+# 입력을 16kHz mono float32 PCM으로 표준 출력에 내보내는 ffmpeg 명령
+FFMPEG_DECODE = [
+    "ffmpeg", "-nostdin", "-threads", "0", "-loglevel", "error",
+    "-i", "{input}", "-vn", "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"
+]
+
+
+class AudioDecodeError(Exception):
+    """ffmpeg가 입력을 디코딩하지 못함"""
+
+
+class InputTooLargeError(Exception):
+    """입력이 허용된 최대 크기를 넘음"""
+
+
+class SizeLimitedReader:
+    """읽은 내용의 SHA-256을 누적하고, 바이트 수가 max_bytes를 넘으면 InputTooLargeError를 내는 파일 객체 래퍼"""
+
+    def __init__(self, fileobj, max_bytes):
+        self.fileobj = fileobj
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        self.bytes_read += len(data)
+        if self.max_bytes and self.bytes_read > self.max_bytes:
+            raise InputTooLargeError(f"업로드 크기가 최대 {self.max_bytes // (1024 * 1024)}MB를 넘습니다.")
+        return data
+
+
+def hash_fileobj(fileobj, chunk_size=1024 * 1024, max_bytes=0):
+    """읽기/이동 가능한 파일 객체 전체의 SHA-256을 계산하고 처음 위치로 되돌림 (max_bytes를 넘으면 InputTooLargeError)"""
+    reader = SizeLimitedReader(fileobj, max_bytes)
+    while reader.read(chunk_size):
+        pass
+    fileobj.seek(0)
+    return reader.sha256.hexdigest()
+
+
+def _ffmpeg_command(source):
+    return [source if arg == "{input}" else arg for arg in FFMPEG_DECODE]
+
+
+def _pcm_to_array(stdout, stderr, returncode):
+    if returncode != 0:
+        raise AudioDecodeError(f"ffmpeg 디코딩 실패: {stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(stdout, dtype=np.float32)
+
+
+def decode_audio_file(path):
+    """파일을 ffmpeg로 한 번에 16kHz mono float32 배열로 디코딩 (중간 WAV 파일 없음)"""
+    process = subprocess.run(_ffmpeg_command(path), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return _pcm_to_array(process.stdout, process.stderr, process.returncode)
+
+
+def decode_audio_stream(chunks):
+    """바이트 조각들을 ffmpeg 표준 입력으로 흘려보내며 디코딩 (입력 전체를 메모리나 디스크에 두지 않음)"""
+    process = subprocess.Popen(_ffmpeg_command("pipe:0"), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    feed_errors = []
+
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            # ffmpeg가 먼저 종료한 경우 (오류는 종료 코드로 확인). 입력 해시가 완성되도록 나머지는 읽어서 버림
+            for _ in chunks:
+                pass
+        except Exception as e:
+            # 입력 쪽 오류(크기 초과 등)는 ffmpeg를 멈추고 호출한 쪽에서 다시 발생시킴
+            feed_errors.append(e)
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    reader.start()
+    stdout = process.stdout.read()
+    writer.join()
+    reader.join()
+    if feed_errors:
+        process.wait()
+        raise feed_errors[0]
+    return _pcm_to_array(stdout, stderr[0] if stderr else b"", process.wait())
+
+
+def requires_seekable_input(head):
+    """MP4/MOV/M4A 계열에서 moov 박스가 mdat 뒤에 있어 파이프로는 디코딩할 수 없는지 판단
+
+    파일 앞부분(head)의 최상위 박스를 차례로 읽어 moov가 먼저 나오면 스트리밍 가능하다.
+    ISO BMFF가 아닌 형식(WAV, MP3 등)은 항상 스트리밍 가능으로 본다.
+    """
+    if head[4:8] != b"ftyp":
+        return False
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box_type = struct.unpack(">I4s", head[offset:offset + 8])
+        if box_type == b"moov":
+            return False
+        if box_type == b"mdat" or size < 8:
+            return True
+        offset += size
+    # 앞부분 안에서 moov를 찾지 못하면 안전하게 파일로 처리
+    return True
+
+
+def decode_audio_fileobj(fileobj, chunk_size=1024 * 1024, head_size=64 * 1024, max_bytes=0):
+    """읽기 가능한 파일 객체를 chunk_size 단위로 읽으며 디코딩하고 (오디오, 입력의 SHA-256)을 반환
+
+    moov가 앞에 있는 MP4나 일반 오디오는 ffmpeg로 바로 흘려보내고, 그렇지 않은 MP4만 임시 파일에 옮겨 디코딩한다.
+    max_bytes가 0이 아니면 그보다 큰 입력은 InputTooLargeError로 중단한다.
+    """
+    reader = SizeLimitedReader(fileobj, max_bytes)
+    head = reader.read(head_size)
+    if not requires_seekable_input(head):
+        rest = iter(lambda: reader.read(chunk_size), b"")
+        audio = decode_audio_stream(_prepend(head, rest))
+    else:
+        with NamedTemporaryFile(suffix=".mp4") as temp_file:
+            temp_file.write(head)
+            shutil.copyfileobj(reader, temp_file, chunk_size)
+            temp_file.flush()
+            audio = decode_audio_file(temp_file.name)
+    return audio, reader.sha256.hexdigest()
+
+
+def _prepend(head, chunks):
+    yield head
+    yield from chunks
+
+
+def frame_energy(audio, frame_length):
+    """frame_length 샘플 단위 프레임별 RMS 에너지 (마지막 남는 샘플은 0으로 채움)"""
+    frames = -(-len(audio) // frame_length)
+    padded = np.zeros(frames * frame_length, dtype=np.float32)
+    padded[:len(audio)] = audio
+    return np.sqrt(np.mean(padded.reshape(frames, frame_length) ** 2, axis=1))
+
+
+def split_on_silence(audio, chunk_seconds=30.0, search_seconds=5.0, overlap_seconds=1.0):
+    """오디오를 chunk_seconds 이하의 구간으로 나눠 (시작, 끝) 샘플 위치 목록을 반환
+
+    각 경계는 목표 위치 앞 search_seconds 안에서 가장 조용한 프레임으로 옮겨 말 중간이 잘리지 않게 하고,
+    그래도 잘린 단어를 복원할 수 있도록 다음 구간은 overlap_seconds만큼 앞에서 시작한다.
+    """
+    chunk_length = int(chunk_seconds * SAMPLE_RATE)
+    if len(audio) <= chunk_length:
+        return [(0, len(audio))]
+
+    frame_length = int(FRAME_SECONDS * SAMPLE_RATE)
+    energy = frame_energy(audio, frame_length)
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    search = int(search_seconds * SAMPLE_RATE)
+
+    windows = []
+    start = 0
+    while len(audio) - start > chunk_length:
+        target = start + chunk_length
+        low = max(start + overlap + frame_length, target - search)
+        first_frame, last_frame = low // frame_length, target // frame_length
+        if last_frame > first_frame:
+            boundary = (first_frame + int(np.argmin(energy[first_frame:last_frame]))) * frame_length
+        else:
+            boundary = target
+        windows.append((start, boundary))
+        start = max(boundary - overlap, start + 1)
+    windows.append((start, len(audio)))
+    return windows
+
+
+def speech_regions(audio, margin_db=12.0, floor_db=-50.0, ceiling_db=-35.0, min_silence_seconds=1.0, padding_seconds=0.25):
+    """프레임 에너지로 음성 구간을 찾아 (시작, 끝) 샘플 위치 목록을 반환
+
+    잡음 수준(하위 5% 프레임 에너지)보다 margin_db 이상 큰 프레임을 음성으로 보되, 기준은 [floor_db, ceiling_db]로 제한한다.
+    음성 앞뒤로 padding_seconds를 남기고, min_silence_seconds보다 짧은 침묵은 자르지 않는다.
+    """
+    if len(audio) == 0:
+        return []
+    frame_length = int(FRAME_SECONDS * SAMPLE_RATE)
+    energy_db = 20 * np.log10(frame_energy(audio, frame_length) + 1e-10)
+    threshold = np.clip(np.percentile(energy_db, 5) + margin_db, floor_db, ceiling_db)
+    speech = energy_db > threshold
+
+    padding = int(padding_seconds / FRAME_SECONDS)
+    if padding:
+        speech = np.convolve(speech.astype(np.int32), np.ones(2 * padding + 1, dtype=np.int32), mode="same") > 0
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    min_gap = int(min_silence_seconds / FRAME_SECONDS)
+    regions = []
+    for start, end in zip(edges[0::2], edges[1::2]):
+        if regions and start - regions[-1][1] < min_gap:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    return [(int(start) * frame_length, min(int(end) * frame_length, len(audio))) for start, end in regions]
+
+
+def trim_silence(audio, **kwargs):
+    """침묵 구간을 잘라낸 오디오와 타임스탬프 대응표 [(잘라낸 뒤 시작 초, 원본 시작 초, 길이 초)]를 반환"""
+    regions = speech_regions(audio, **kwargs)
+    timestamp_map = []
+    kept = 0
+    for start, end in regions:
+        timestamp_map.append((kept / SAMPLE_RATE, start / SAMPLE_RATE, (end - start) / SAMPLE_RATE))
+        kept += end - start
+    trimmed = np.concatenate([audio[start:end] for start, end in regions]) if regions else audio[:0]
+    return trimmed, timestamp_map
+
+
+def to_original_time(seconds, timestamp_map):
+    """잘라낸 오디오 기준 시각을 원본 오디오 기준 시각으로 변환"""
+    for trimmed_start, original_start, length in reversed(timestamp_map):
+        if seconds >= trimmed_start:
+            return round(original_start + min(seconds - trimmed_start, length), 2)
+    return seconds
+
+
+def overlap_length(previous_words, following_words, max_overlap_words=12):
+    """앞 구간 끝과 뒷 구간 앞에서 겹치는 가장 긴 단어열의 길이"""
+    for size in range(min(max_overlap_words, len(previous_words), len(following_words)), 0, -1):
+        if previous_words[-size:] == following_words[:size]:
+            return size
+    return 0
+
+
+def stitch_transcripts(results, max_overlap_words=12):
+    """구간 순서대로 정렬된 변환 결과({"text", "segments"})를 겹친 단어를 한 번만 남기고 합침"""
+    words = []
+    segments = []
+    for result in results:
+        chunk_words = result["text"].split()
+        skip = overlap_length(words, chunk_words, max_overlap_words)
+        words.extend(chunk_words[skip:])
+        # 중복으로 빠진 단어만큼 이번 구간 앞쪽 세그먼트에서도 제거
+        for segment in result["segments"]:
+            segment_words = segment["text"].split()
+            if skip >= len(segment_words):
+                skip -= len(segment_words)
+                continue
+            segments.append({**segment, "text": " ".join(segment_words[skip:])})
+            skip = 0
+    return {"text": " ".join(words), "segments": segments}
+
+
+def offset_segments(segments, offset_seconds):
+    return [
+        {"start": round(segment["start"] + offset_seconds, 2), "end": round(segment["end"] + offset_seconds, 2), "text": segment["text"].strip()}
+        for segment in segments
+    ]
+
+
+# ---------------------------------------------------------------------------
+# CPU 프로세스 풀 작업자 (각 프로세스가 자기 Whisper 모델을 가짐)
+# ---------------------------------------------------------------------------
+
+_worker_model = None
+_warmup_barrier = None
+
+# 워밍업에서 다른 작업자를 기다리는 최대 시간 (초)
+WARMUP_BARRIER_TIMEOUT = 600
+
+
+def init_worker(model_name, threads, warmup_barrier=None):
+    global _worker_model, _warmup_barrier
+    import torch
+    import whisper
+
+    torch.set_num_threads(threads)
+    _worker_model = whisper.load_model(model_name, device="cpu")
+    _warmup_barrier = warmup_barrier
+
+
+def warmup_worker(chunk):
+    """모든 작업자가 모델을 로드할 때까지 기다린 뒤 구간 하나를 변환
+
+    기다리는 동안 다른 워밍업 작업을 가져가지 않으므로, 작업자 수만큼 보내면 작업자마다 정확히 하나씩 실행된다.
+    """
+    if _warmup_barrier is not None:
+        try:
+            _warmup_barrier.wait(WARMUP_BARRIER_TIMEOUT)
+        except threading.BrokenBarrierError:
+            print("Whisper 작업자 워밍업: 일부 작업자를 기다리지 못했습니다.")
+    return transcribe_chunk(chunk, 0.0)
+
+
+def transcribe_chunk(chunk, offset_seconds, language=None):
+    """작업자 프로세스에서 구간 하나를 변환하고 세그먼트 시각을 원본 기준으로 옮김"""
+    result = _worker_model.transcribe(chunk, verbose=None, language=language, fp16=False)
+    return {"text": result["text"], "segments": offset_segments(result["segments"], offset_seconds)}
@@ -1,14 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse
 import torch
 import os
+import json
+import hashlib
+import time
 from pydantic import BaseModel
-from moviepy.editor import VideoFileClip
+from typing import Dict, List, Literal, Optional, Union
 from tempfile import NamedTemporaryFile
-import whisper
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 import aiofiles
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from scheduler import GenerationRequest, GenerationCancelledError, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from engines import TransformersEngine, CPUEngine, WhisperTranscriber, MockEngine, MockTranscriber
+import audio_processing
+from audio_processing import AudioDecodeError, InputTooLargeError, decode_audio_file, decode_audio_fileobj, hash_fileobj
+from prefix_cache import PrefixCache
+from response_cache import ResponseCache, request_cache_key
+from jobs import JobStore
+from output_budget import OutputBudget
+from structured_output import JsonSchemaConstraint, question_response_schema
+from model_loader import ModelLoader, ModelUnavailableError
+from admission import AdmissionLimiter, QueueFullError
+from metrics import MetricsRegistry, TOKEN_BUCKETS, process_memory
+from starlette.routing import Match
 
 # FastAPI 인스턴스 생성
 app = FastAPI()
@@ -16,127 +32,938 @@ app = FastAPI()
 # 디바이스 설정
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-# Whisper 모델 로드
-print("Whisper 모델 로딩 중...")
-whisper_model = whisper.load_model("small").to(device)
-print("Whisper 모델 로딩 완료")
+# 생성 설정
+MAX_NEW_TOKENS = 16384
+# CPU에서는 배치가 커질수록 스텝 시간도 비례해 늘어나므로 기본 배치를 작게 둠
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "8" if torch.cuda.is_available() else "4"))
+# 프롬프트 + 컨텍스트 입력 토큰 최대 수 (넘으면 채팅 템플릿은 그대로 두고 컨텍스트 끝을 잘라냄)
+MAX_INPUT_TOKENS = int(os.environ.get("MAX_INPUT_TOKENS", "8192"))
+# 채점처럼 한 토큰만 필요한 요청을 한 번에 prefill하는 최대 개수
+MAX_PREFILL_BATCH_SIZE = int(os.environ.get("MAX_PREFILL_BATCH_SIZE", "32"))
+# 일괄 생성이 차지하지 못하게 대화형 요청용으로 남겨 두는 배치 자리 수와, 일괄 요청이 대화형 요청에 밀려 기다리는 최대 시간 (초)
+INTERACTIVE_SLOTS = int(os.environ.get("INTERACTIVE_SLOTS", "1"))
+MAX_BULK_WAIT_SECONDS = float(os.environ.get("MAX_BULK_WAIT_SECONDS", "30"))
+
+# 시스템 프롬프트 prefix KV 캐시 설정 (0이면 비활성화)
+PREFIX_CACHE_MAX_MB = int(os.environ.get("PREFIX_CACHE_MAX_MB", "1024"))
+PREFIX_CACHE_BLOCK_SIZE = int(os.environ.get("PREFIX_CACHE_BLOCK_SIZE", "64"))
+
+# 동일 요청에 대한 응답 캐시 설정 (RESPONSE_CACHE_MAX_MB가 0이면 비활성화)
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "cache/responses.sqlite3")
+RESPONSE_CACHE_MEMORY_ITEMS = int(os.environ.get("RESPONSE_CACHE_MEMORY_ITEMS", "1024"))
+RESPONSE_CACHE_MAX_MB = int(os.environ.get("RESPONSE_CACHE_MAX_MB", "512"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+
+# 요청한 문제 수로 생성 토큰 한도를 정할 때 쓰는 유형별 출력 길이 프로파일
+OUTPUT_BUDGET_PATH = os.environ.get("OUTPUT_BUDGET_PATH", "cache/output_budget.json")
+OUTPUT_BUDGET_MARGIN = float(os.environ.get("OUTPUT_BUDGET_MARGIN", "1.5"))
+
+# 같은 미디어의 변환 결과 캐시 설정 (TRANSCRIPT_CACHE_MAX_MB가 0이면 비활성화)
+TRANSCRIPT_CACHE_PATH = os.environ.get("TRANSCRIPT_CACHE_PATH", "cache/transcripts.sqlite3")
+TRANSCRIPT_CACHE_MAX_MB = int(os.environ.get("TRANSCRIPT_CACHE_MAX_MB", "256"))
+TRANSCRIPT_CACHE_TTL = int(os.environ.get("TRANSCRIPT_CACHE_TTL", str(30 * 24 * 3600)))
+
+# 업로드 최대 크기 (0이면 제한 없음)와 업로드를 읽는 단위
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "4096"))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# 끝난 비동기 작업을 보관하는 시간 (초)
+JOB_TTL = int(os.environ.get("JOB_TTL", "3600"))
+
+# 엔드포인트별 동시 실행 수와 대기열 길이 (둘 다 차면 대기하지 않고 429로 거절)
+GENERATE_MAX_CONCURRENT = int(os.environ.get("GENERATE_MAX_CONCURRENT", str(MAX_BATCH_SIZE)))
+GENERATE_MAX_QUEUE = int(os.environ.get("GENERATE_MAX_QUEUE", "32"))
+GRADING_MAX_CONCURRENT = int(os.environ.get("GRADING_MAX_CONCURRENT", "64"))
+GRADING_MAX_QUEUE = int(os.environ.get("GRADING_MAX_QUEUE", "256"))
+TRANSCRIBE_MAX_CONCURRENT = int(os.environ.get("TRANSCRIBE_MAX_CONCURRENT", "2"))
+TRANSCRIBE_MAX_QUEUE = int(os.environ.get("TRANSCRIBE_MAX_QUEUE", "8"))
+
+# 추론 엔진: transformers(GPU 4bit 양자화 모델 + Whisper), cpu(GPU 없는 서버용 int8 동적 양자화 모델 + Whisper)
+# 또는 mock(GPU 없이 부하 테스트용 모의 엔진). 지정하지 않으면 GPU 유무로 고름
+INFERENCE_ENGINE = os.environ.get("INFERENCE_ENGINE", "transformers" if torch.cuda.is_available() else "cpu")
+# cpu 엔진 설정: 연산 스레드 수, 양자화 여부(int8 또는 none), 사용할 모델 (지정하지 않으면 GPU와 같은 모델)
+CPU_THREADS = int(os.environ.get("CPU_THREADS", str(os.cpu_count() or 1)))
+CPU_QUANTIZATION = os.environ.get("CPU_QUANTIZATION", "int8")
+CPU_MODEL_ID = os.environ.get("CPU_MODEL_ID")
+MOCK_TOKENS_PER_SECOND = float(os.environ.get("MOCK_TOKENS_PER_SECOND", "50"))
+MOCK_LATENCY_MS = float(os.environ.get("MOCK_LATENCY_MS", "200"))
+MOCK_LATENCY_SIGMA = float(os.environ.get("MOCK_LATENCY_SIGMA", "0.5"))
+MOCK_TRANSCRIBE_MS = float(os.environ.get("MOCK_TRANSCRIBE_MS", "1000"))
+MOCK_SEED = int(os.environ.get("MOCK_SEED", "0"))
+
+# 모델 로딩 방식: startup(서버 시작 후 백그라운드에서 병렬 로드), lazy(첫 요청 시 로드), disabled(사용 안 함)
+LLM_LOADING = os.environ.get("LLM_LOADING", "startup")
+WHISPER_LOADING = os.environ.get("WHISPER_LOADING", "startup")
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "small")
+# 긴 오디오를 나눠 변환하는 설정 (구간 길이는 최대 30초, GPU는 묶음 디코딩, CPU는 작업자 프로세스 수만큼 병렬)
+TRANSCRIBE_CHUNK_SECONDS = float(os.environ.get("TRANSCRIBE_CHUNK_SECONDS", "30"))
+TRANSCRIBE_OVERLAP_SECONDS = float(os.environ.get("TRANSCRIBE_OVERLAP_SECONDS", "1.0"))
+TRANSCRIBE_BATCH_SIZE = int(os.environ.get("TRANSCRIBE_BATCH_SIZE", "8"))
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", str(min(4, os.cpu_count() or 1))))
+TRANSCRIBE_LANGUAGE = os.environ.get("TRANSCRIBE_LANGUAGE") or None  # 지정하지 않으면 구간마다 자동 감지
+# 변환 전에 긴 침묵을 잘라내는 에너지 기반 음성 구간 검출 (VAD_ENABLED=1이면 사용)
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "0") == "1"
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", "12"))
+VAD_MIN_SILENCE_SECONDS = float(os.environ.get("VAD_MIN_SILENCE_SECONDS", "1.0"))
+VAD_PADDING_SECONDS = float(os.environ.get("VAD_PADDING_SECONDS", "0.25"))
+# 로드 직후 짧은 더미 생성/변환으로 커널 초기화 비용을 미리 치름 (0이면 생략)
+WARMUP_MAX_NEW_TOKENS = int(os.environ.get("WARMUP_MAX_NEW_TOKENS", "8"))
 
-# GPT 모델과 토크나이저 초기화
-model, tokenizer = None, None
 model_id = "Qwen/Qwen2-7B-Instruct"
 #model_id = "Qwen/Qwen2-57B-A14B-Instruct"
 
-def load_gpt_model_and_tokenizer():
-    global model, tokenizer
-    if model is None or tokenizer is None:
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,  # 4bit 양자화 활성화
-            llm_int8_enable_fp32_cpu_offload=False,  # CPU 오프로딩 비활성화 (GPU만 사용)
-            bnb_4bit_compute_dtype=torch.bfloat16,  # 4080 GPU에서 bfloat16을 사용하여 계산 최적화
-            bnb_4bit_quant_type="nf4",  # NF4 양자화 유형 사용 (FP4보다 높은 정확도와 안정성)
-            llm_int8_has_fp16_weight=True  # LLM.int8()과 함께 16-bit 가중치 사용 (백워드 패스 최적화)
-        )
-        model = AutoModelForCausalLM.from_pretrained(
-            model_id,
-            quantization_config=quantization_config,
-            torch_dtype="bfloat16",
-            device_map="auto"
-        )
-        tokenizer = AutoTokenizer.from_pretrained(model_id)
-    return model, tokenizer
+# assisted generation에 쓸 초안 모델 (같은 토크나이저를 쓰는 작은 모델, 예: Qwen/Qwen2-0.5B-Instruct)과 라운드당 제안 토큰 수
+DRAFT_MODEL_ID = os.environ.get("DRAFT_MODEL_ID") or None
+DRAFT_NUM_TOKENS = int(os.environ.get("DRAFT_NUM_TOKENS", "5"))
 
-model, tokenizer = load_gpt_model_and_tokenizer()
+# 4bit 양자화 결과를 저장해 두고 재시작 시 바로 읽는 디렉터리 (비우면 매번 원본을 양자화)
+QUANTIZED_MODEL_DIR = os.environ.get("QUANTIZED_MODEL_DIR", f"models/{model_id.split('/')[-1]}-nf4")
 
-async def extract_audio_from_mp4(mp4_file_path, output_audio_path="extracted_audio.wav"):
-    """MP4 파일에서 오디오를 추출하여 WAV 파일로 저장"""
-    loop = asyncio.get_event_loop()
-    video = await loop.run_in_executor(None, VideoFileClip, mp4_file_path)
-    audio = video.audio
-    await loop.run_in_executor(None, audio.write_audiofile, output_audio_path, codec='pcm_s16le')
-    return output_audio_path
+# response_format이 json인 요청의 디코딩을 JSON 스키마로 제약 (lm-format-enforcer가 설치되어 있어야 하며, 0이면 프롬프트 지시만 사용)
+STRUCTURED_OUTPUT_ENFORCE = os.environ.get("STRUCTURED_OUTPUT_ENFORCE", "1") == "1"
 
-async def transcribe_audio_file(audio_file_path):
-    """WAV, M4A, MP3 등 파일을 텍스트로 변환"""
-    loop = asyncio.get_event_loop()
-    audio = await loop.run_in_executor(None, whisper.load_audio, audio_file_path)
-    result = await loop.run_in_executor(None, whisper_model.transcribe, audio, False)
-    return result['text']
+# 토크나이저, 채점 라벨 토큰, 스케줄러, JSON 스키마 제약 (LLM 로드가 끝나면 채워짐)
+tokenizer = None
+GRADING_LABEL_TOKENS = None
+scheduler = None
+json_constraint = None
 
-@app.post("/transcribe_video/")
-async def transcribe_video(file: UploadFile = File(...)):
+# 반복되는 시스템 프롬프트의 prefill 결과를 재사용하기 위한 캐시
+prefix_cache = PrefixCache(PREFIX_CACHE_MAX_MB * 1024 * 1024, PREFIX_CACHE_BLOCK_SIZE) if PREFIX_CACHE_MAX_MB > 0 else None
+
+# 동일한 (프롬프트, 컨텍스트, 샘플링 설정) 요청의 응답을 재사용하기 위한 캐시
+response_cache = ResponseCache(
+    RESPONSE_CACHE_PATH,
+    memory_items=RESPONSE_CACHE_MEMORY_ITEMS,
+    max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+    ttl=RESPONSE_CACHE_TTL
+) if RESPONSE_CACHE_MAX_MB > 0 else None
+
+# 생성 엔진과 음성 변환 엔진
+if INFERENCE_ENGINE == "mock":
+    engine = MockEngine(
+        max_batch_size=MAX_BATCH_SIZE,
+        tokens_per_second=MOCK_TOKENS_PER_SECOND,
+        latency_ms=MOCK_LATENCY_MS,
+        latency_sigma=MOCK_LATENCY_SIGMA,
+        seed=MOCK_SEED,
+        interactive_slots=INTERACTIVE_SLOTS
+    )
+    transcriber = MockTranscriber(latency_ms=MOCK_TRANSCRIBE_MS)
+else:
+    engine_options = dict(
+        max_batch_size=MAX_BATCH_SIZE,
+        max_prefill_batch_size=MAX_PREFILL_BATCH_SIZE,
+        prefix_cache=prefix_cache,
+        warmup_tokens=WARMUP_MAX_NEW_TOKENS,
+        interactive_slots=INTERACTIVE_SLOTS,
+        max_bulk_wait=MAX_BULK_WAIT_SECONDS,
+        draft_model_id=DRAFT_MODEL_ID,
+        num_assistant_tokens=DRAFT_NUM_TOKENS
+    )
+    if INFERENCE_ENGINE == "cpu":
+        engine = CPUEngine(CPU_MODEL_ID or model_id, threads=CPU_THREADS, quantize=CPU_QUANTIZATION == "int8", **engine_options)
+    else:
+        engine = TransformersEngine(model_id, quantized_dir=QUANTIZED_MODEL_DIR or None, **engine_options)
+    transcriber = WhisperTranscriber(
+        WHISPER_MODEL,
+        device,
+        warmup=WARMUP_MAX_NEW_TOKENS > 0,
+        chunk_seconds=TRANSCRIBE_CHUNK_SECONDS,
+        overlap_seconds=TRANSCRIBE_OVERLAP_SECONDS,
+        batch_size=TRANSCRIBE_BATCH_SIZE,
+        workers=TRANSCRIBE_WORKERS,
+        language=TRANSCRIBE_LANGUAGE
+    )
+
+def load_generation_engine():
+    """생성 엔진을 로드하고 토크나이저, 채점 라벨 토큰, 스케줄러, JSON 스키마 제약을 연결"""
+    global tokenizer, GRADING_LABEL_TOKENS, scheduler, json_constraint
+    engine.load()
+    tokenizer = engine.tokenizer
+    # 채점 응답으로 허용하는 라벨과 각 라벨의 첫 토큰 id
+    GRADING_LABEL_TOKENS = {label: tokenizer.encode(label, add_special_tokens=False)[0] for label in ("True", "False")}
+    if STRUCTURED_OUTPUT_ENFORCE and engine.name != "mock":
+        if JsonSchemaConstraint.available():
+            json_constraint = JsonSchemaConstraint(tokenizer).prepare()
+        else:
+            print("lm-format-enforcer가 설치되지 않아 JSON 출력은 프롬프트 지시로만 유도합니다.")
+    scheduler = engine.scheduler
+    return engine
+
+# 모델은 import 시점이 아니라 서버가 뜬 뒤 각자의 스레드에서 로드됨
+llm_loader = ModelLoader("LLM", load_generation_engine, enabled=LLM_LOADING != "disabled")
+transcriber_loader = ModelLoader("Whisper", transcriber.load, enabled=WHISPER_LOADING != "disabled")
+
+# 같은 강의 파일을 여러 번 올려도 한 번만 변환하도록 (미디어 해시, 모델, 언어)별로 결과를 보관
+transcript_cache = ResponseCache(
+    TRANSCRIPT_CACHE_PATH,
+    memory_items=64,
+    max_bytes=TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024,
+    ttl=TRANSCRIPT_CACHE_TTL
+) if TRANSCRIPT_CACHE_MAX_MB > 0 else None
+
+# 문제 유형별 출력 길이 측정값
+output_budget = OutputBudget(OUTPUT_BUDGET_PATH, max_tokens=MAX_NEW_TOKENS, margin=OUTPUT_BUDGET_MARGIN)
+
+# MAX_INPUT_TOKENS를 넘어 컨텍스트를 잘라낸 요청 수와 잘라낸 토큰 수
+input_truncation_stats = {"requests": 0, "dropped_tokens": 0}
+
+# JSON 응답 요청 수와 그중 JSON으로 읽을 수 있었던 응답 수
+structured_stats = {"requests": 0, "constrained": 0, "valid": 0, "truncated": 0}
+
+# 제출 후 상태를 조회하는 비동기 작업 테이블
+job_store = JobStore(ttl=JOB_TTL)
+
+# 생성은 스케줄러 스레드에서, 디코딩/음성 변환은 전용 스레드 풀에서 실행되며 엔드포인트별로 동시 실행 수를 제한
+# 일괄 생성은 대화형 요청용 자리(INTERACTIVE_SLOTS)를 뺀 수만큼만 동시에 실행하여, 대화형 요청이 긴 일괄 생성 뒤에서 기다리지 않게 함
+generate_limiters = {
+    PRIORITY_INTERACTIVE: AdmissionLimiter("생성(대화형)", GENERATE_MAX_CONCURRENT, GENERATE_MAX_QUEUE),
+    PRIORITY_BULK: AdmissionLimiter("생성(일괄)", max(GENERATE_MAX_CONCURRENT - INTERACTIVE_SLOTS, 1), GENERATE_MAX_QUEUE),
+}
+grading_limiter = AdmissionLimiter("채점", GRADING_MAX_CONCURRENT, GRADING_MAX_QUEUE)
+transcribe_limiter = AdmissionLimiter("음성 변환", TRANSCRIBE_MAX_CONCURRENT, TRANSCRIBE_MAX_QUEUE)
+transcribe_executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_MAX_CONCURRENT, thread_name_prefix="transcribe")
+# 채팅 템플릿 적용, 토큰화, 긴 컨텍스트 자르기는 이벤트 루프 밖에서 실행 (fast 토크나이저를 여러 스레드가 함께 쓰지 않도록 스레드 1개)
+tokenize_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenize")
+
+# /metrics로 내보내는 Prometheus 지표 (큐 길이, 처리량, 캐시 등 나머지는 수집 시점에 읽음)
+metrics = MetricsRegistry()
+http_requests = metrics.counter("http_requests_total", "엔드포인트별 요청 수", ("endpoint", "method", "status"))
+http_latency = metrics.histogram("http_request_duration_seconds", "엔드포인트별 응답 시간 (스트리밍은 응답 헤더까지)", ("endpoint",))
+generated_tokens = metrics.histogram("llm_generated_tokens", "생성 요청당 생성 토큰 수", ("priority",), buckets=TOKEN_BUCKETS)
+transcribed_audio_seconds = metrics.counter("transcribe_audio_seconds_total", "Whisper로 변환한 오디오 길이 (초)")
+transcribe_processing_seconds = metrics.counter("transcribe_processing_seconds_total", "음성 변환(VAD 포함)에 걸린 시간 (초)")
+
+@app.on_event("startup")
+async def start_model_loading():
+    # startup 모드의 모델들은 서로 다른 스레드에서 동시에 로드됨
+    for loader, loading in ((llm_loader, LLM_LOADING), (transcriber_loader, WHISPER_LOADING)):
+        if loading == "startup":
+            loader.start()
+
+@app.on_event("shutdown")
+async def stop_engine():
+    if llm_loader.ready:
+        engine.stop()
+    if transcriber_loader.ready:
+        transcriber.stop()
+    transcribe_executor.shutdown(wait=False, cancel_futures=True)
+    tokenize_executor.shutdown(wait=False, cancel_futures=True)
+    output_budget.flush()
+
+@app.exception_handler(QueueFullError)
+async def reject_when_queue_full(request: Request, e: QueueFullError):
+    """대기열이 가득 차면 연결을 붙잡아 두지 않고 바로 429와 재시도 시각을 반환"""
+    return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
+
+UPLOAD_PATHS = ("/transcribe_video/", "/transcribe_audio/", "/jobs/transcribe_video", "/jobs/transcribe_audio")
+
+@app.middleware("http")
+async def reject_large_uploads(request: Request, call_next):
+    """Content-Length가 최대 업로드 크기를 넘으면 본문을 받기 전에 413으로 거절"""
+    if MAX_UPLOAD_MB and request.method == "POST" and request.url.path in UPLOAD_PATHS:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_MB * 1024 * 1024:
+            return JSONResponse(status_code=413, content={"detail": f"업로드 크기가 최대 {MAX_UPLOAD_MB}MB를 넘습니다."})
+    return await call_next(request)
+
+def endpoint_label(request: Request):
+    """지표 라벨이 요청마다 늘어나지 않도록 경로 대신 라우트 경로(/jobs/{job_id} 등)를 사용"""
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "other"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started_at = time.perf_counter()
+    status = 500
     try:
-        async with aiofiles.tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_mp4:
-            content = await file.read()
-            await temp_mp4.write(content)
-            temp_mp4_path = temp_mp4.name
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        endpoint = endpoint_label(request)
+        if endpoint != "/metrics":
+            http_requests.inc(endpoint=endpoint, method=request.method, status=status)
+            http_latency.observe(time.perf_counter() - started_at, endpoint=endpoint)
 
-        # 오디오 추출
-        temp_audio_path = "extracted_audio.wav"
-        audio_file_path = await extract_audio_from_mp4(temp_mp4_path, temp_audio_path)
+@app.get("/health/live")
+async def health_live():
+    """프로세스가 요청을 받을 수 있는지 (모델 로드 여부와 무관)"""
+    return {"status": "ok"}
 
-        # 오디오 파일을 텍스트로 변환
-        transcription = await transcribe_audio_file(audio_file_path)
+@app.get("/health/ready")
+async def health_ready():
+    """startup 모드로 설정된 모델이 모두 로드되고 워밍업까지 끝났는지"""
+    models = {"engine": engine.name, "llm": llm_loader.status(), "whisper": transcriber_loader.status()}
+    ready = all(
+        loader.ready
+        for loader, loading in ((llm_loader, LLM_LOADING), (transcriber_loader, WHISPER_LOADING))
+        if loading == "startup"
+    )
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "models": models})
 
-        # 임시 파일 삭제
-        os.remove(temp_mp4_path)
-        os.remove(temp_audio_path)
+def get_cached_transcript(media_sha256):
+    """(캐시 키, 캐시된 {"text", "segments"} 또는 None)"""
+    if transcript_cache is None:
+        return None, None
+    key = request_cache_key({
+        "media_sha256": media_sha256,
+        "model": transcriber.cache_id,
+        "language": TRANSCRIBE_LANGUAGE or "auto",
+        "vad": [VAD_MARGIN_DB, VAD_MIN_SILENCE_SECONDS, VAD_PADDING_SECONDS] if VAD_ENABLED else None,
+    })
+    return key, transcript_cache.get(key)
 
-        # 플레인 텍스트로 반환
-        return PlainTextResponse(content=transcription)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# 침묵 제거로 Whisper에 넘기지 않은 오디오 길이 누적
+vad_stats = {"files": 0, "input_seconds": 0.0, "kept_seconds": 0.0}
 
-@app.post("/transcribe_audio/")
-async def transcribe_audio(file: UploadFile = File(...)):
+def trim_silence(audio):
+    """침묵을 잘라낸 오디오와 원본 시각 대응표, 유지/제거 길이 통계를 반환"""
+    trimmed, timestamp_map = audio_processing.trim_silence(
+        audio,
+        margin_db=VAD_MARGIN_DB,
+        min_silence_seconds=VAD_MIN_SILENCE_SECONDS,
+        padding_seconds=VAD_PADDING_SECONDS
+    )
+    input_seconds = len(audio) / audio_processing.SAMPLE_RATE
+    kept_seconds = len(trimmed) / audio_processing.SAMPLE_RATE
+    vad_stats["files"] += 1
+    vad_stats["input_seconds"] += input_seconds
+    vad_stats["kept_seconds"] += kept_seconds
+    stats = {
+        "input_seconds": round(input_seconds, 1),
+        "kept_seconds": round(kept_seconds, 1),
+        "dropped_seconds": round(input_seconds - kept_seconds, 1),
+        "kept_ratio": round(kept_seconds / input_seconds, 3) if input_seconds else 0,
+    }
+    print(f"침묵 제거: {stats['input_seconds']}초 중 {stats['kept_seconds']}초 유지 ({stats['kept_ratio']:.1%})")
+    return trimmed, timestamp_map, stats
+
+def transcribe_with_vad(loaded_transcriber, audio):
+    """(VAD를 켠 경우) 침묵을 잘라낸 뒤 변환하고 세그먼트 시각을 원본 기준으로 되돌림"""
+    if not VAD_ENABLED:
+        return loaded_transcriber.transcribe(audio)
+    trimmed, timestamp_map, stats = trim_silence(audio)
+    if len(trimmed) == 0:
+        return {"text": "", "segments": [], "vad": stats}
+    result = loaded_transcriber.transcribe(trimmed)
+    segments = [
+        {
+            **segment,
+            "start": audio_processing.to_original_time(segment["start"], timestamp_map),
+            "end": audio_processing.to_original_time(segment["end"], timestamp_map),
+        }
+        for segment in result["segments"]
+    ]
+    return {**result, "segments": segments, "vad": stats}
+
+async def transcribe_audio_array(audio, cache_key=None):
+    """16kHz mono float32 오디오를 {"text", "segments"}로 변환하고 cache_key가 있으면 캐시에 저장"""
+    loaded_transcriber = await transcriber_loader.get()
+    loop = asyncio.get_event_loop()
+    started_at = time.perf_counter()
+    result = await loop.run_in_executor(transcribe_executor, transcribe_with_vad, loaded_transcriber, audio)
+    transcribed_audio_seconds.inc(len(audio) / audio_processing.SAMPLE_RATE)
+    transcribe_processing_seconds.inc(time.perf_counter() - started_at)
+    if cache_key is not None:
+        transcript_cache.set(cache_key, result)
+    return result
+
+async def transcribe_upload(file: UploadFile):
+    """디스크에 임시 저장된 업로드의 해시를 먼저 계산하고, 캐시에 없을 때만 ffmpeg로 디코딩해 변환. (결과, 캐시 적중 여부) 반환"""
+    loop = asyncio.get_event_loop()
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    media_sha256 = await loop.run_in_executor(transcribe_executor, hash_fileobj, file.file, UPLOAD_CHUNK_SIZE, max_bytes)
+    cache_key, cached = get_cached_transcript(media_sha256)
+    if cached is not None:
+        return cached, True
+    audio, _ = await loop.run_in_executor(
+        transcribe_executor,
+        lambda: decode_audio_fileobj(file.file, chunk_size=UPLOAD_CHUNK_SIZE, max_bytes=max_bytes)
+    )
+    return await transcribe_audio_array(audio, cache_key), False
+
+def remove_file(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+async def save_upload(file: UploadFile, suffix):
+    """업로드된 파일을 UPLOAD_CHUNK_SIZE 단위로 임시 파일에 옮기고 (경로, SHA-256)을 반환 (최대 크기를 넘으면 삭제 후 오류)"""
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    size = 0
+    sha256 = hashlib.sha256()
+    async with aiofiles.tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise InputTooLargeError(f"업로드 크기가 최대 {MAX_UPLOAD_MB}MB를 넘습니다.")
+                sha256.update(chunk)
+                await temp_file.write(chunk)
+        except Exception:
+            await temp_file.close()
+            remove_file(temp_file.name)
+            raise
+        return temp_file.name, sha256.hexdigest()
+
+async def transcribe_saved_upload(job, path, media_sha256):
+    """저장된 영상/오디오 파일을 (캐시에 없을 때만) 디코딩해 텍스트로 변환하고 임시 파일을 삭제"""
     try:
-        async with aiofiles.tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-            content = await file.read()
-            await temp_audio.write(content)
-            temp_audio_path = temp_audio.name
+        cache_key, cached = get_cached_transcript(media_sha256)
+        job.info["transcript_cache"] = "hit" if cached is not None else "miss"
+        if cached is not None:
+            return cached["text"]
 
-        # 오디오 파일을 텍스트로 변환
-        transcription = await transcribe_audio_file(temp_audio_path)
+        loop = asyncio.get_event_loop()
+        audio = await loop.run_in_executor(transcribe_executor, decode_audio_file, path)
+        job.set_progress(0.2)
+        result = await transcribe_audio_array(audio, cache_key)
+        return result["text"]
+    finally:
+        remove_file(path)
 
-        # 임시 파일 삭제
-        os.remove(temp_audio_path)
+def transcript_response(result, cache_hit, with_segments):
+    """변환 결과를 텍스트(기본) 또는 세그먼트 포함 JSON으로 반환하고 캐시 적중 여부를 헤더에 표시"""
+    headers = {"X-Transcript-Cache": "hit" if cache_hit else "miss"}
+    if with_segments:
+        return JSONResponse(content=result, headers=headers)
+    return PlainTextResponse(content=result["text"], headers=headers)
 
-        # 플레인 텍스트로 반환
-        return PlainTextResponse(content=transcription)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.post("/transcribe_video/")
+async def transcribe_video(file: UploadFile = File(...), with_segments: bool = False):
+    async with transcribe_limiter.admit():
+        try:
+            result, cache_hit = await transcribe_upload(file)
+
+            # 플레인 텍스트로 반환 (with_segments면 타임스탬프가 포함된 JSON)
+            return transcript_response(result, cache_hit, with_segments)
+        except ModelUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except InputTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except AudioDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/transcribe_audio/")
+async def transcribe_audio(file: UploadFile = File(...), with_segments: bool = False):
+    async with transcribe_limiter.admit():
+        try:
+            result, cache_hit = await transcribe_upload(file)
+
+            # 플레인 텍스트로 반환 (with_segments면 타임스탬프가 포함된 JSON)
+            return transcript_response(result, cache_hit, with_segments)
+        except ModelUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except InputTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except AudioDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 class PromptRequest(BaseModel):
     prompt: str
     context: str
+    max_new_tokens: int = MAX_NEW_TOKENS
+    temperature: float = 0.3
+    top_p: float = 0.7
+    top_k: int = 50
+    no_cache: bool = False  # 샘플링 결과가 매번 달라야 하는 요청은 응답 캐시를 건너뜀
+    user_id: Optional[Union[int, str]] = None  # /emergency_stop에서 사용자 단위로 중단할 때 사용
+    expected_output: Optional[Dict[str, int]] = None  # 문제 유형별 생성할 문제 수 (생성 토큰 한도 계산에 사용)
+    priority: Literal["interactive", "bulk"] = PRIORITY_BULK  # 사용자가 결과를 기다리는 요청은 interactive
+    response_format: Literal["text", "json"] = "text"  # json이면 expected_output에 맞는 문제 JSON 스키마로 디코딩을 제약
+
+def response_cache_key(endpoint, request: PromptRequest):
+    """응답에 영향을 주는 필드만으로 캐시 키 생성"""
+    payload = request.dict(exclude={"no_cache", "user_id", "priority"})
+    payload.update({"endpoint": endpoint, "model_id": engine.model_id})
+    return request_cache_key(payload)
+
+def get_cached_response(endpoint, request: PromptRequest):
+    if response_cache is None or request.no_cache:
+        return None, None
+    key = response_cache_key(endpoint, request)
+    return key, response_cache.get(key)
+
+class PromptTooLongError(Exception):
+    """컨텍스트를 모두 잘라내도 입력이 MAX_INPUT_TOKENS를 넘음 (프롬프트 자체가 너무 김)"""
+
+def chat_input_ids(prompt, context):
+    """프롬프트와 컨텍스트를 채팅 템플릿으로 토큰화하여 (메시지, 입력 토큰 id)를 반환"""
+    messages = [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": context}
+    ]
+    text = tokenizer.apply_chat_template(
+        messages,
+        tokenize=False,
+        add_generation_prompt=True
+    )
+    return messages, tokenizer(text).input_ids
+
+def build_generation_request(request: PromptRequest):
+    """프롬프트와 컨텍스트를 채팅 템플릿으로 토큰화하여 스케줄러 요청 생성"""
+    messages, input_ids = chat_input_ids(request.prompt, request.context)
+    if len(input_ids) > MAX_INPUT_TOKENS:
+        # 뒤에서 자르면 assistant 시작 토큰이 사라지므로 컨텍스트 끝을 잘라 다시 토큰화 (경계에서 토큰이 합쳐질 수 있어 반복)
+        context_ids = tokenizer.encode(request.context, add_special_tokens=False)
+        keep = len(context_ids)
+        while len(input_ids) > MAX_INPUT_TOKENS:
+            keep -= len(input_ids) - MAX_INPUT_TOKENS
+            if keep <= 0:
+                raise PromptTooLongError(f"프롬프트가 최대 입력 길이 {MAX_INPUT_TOKENS}토큰을 넘습니다.")
+            messages, input_ids = chat_input_ids(request.prompt, tokenizer.decode(context_ids[:keep]))
+        input_truncation_stats["requests"] += 1
+        input_truncation_stats["dropped_tokens"] += len(context_ids) - keep
+        print(f"입력이 최대 {MAX_INPUT_TOKENS}토큰을 넘어 컨텍스트 끝 {len(context_ids) - keep}토큰을 잘랐습니다.")
+    max_new_tokens = min(request.max_new_tokens, MAX_NEW_TOKENS)
+    if request.expected_output:
+        max_new_tokens = min(max_new_tokens, output_budget.budget(request.expected_output, request.response_format))
+    generation_request = GenerationRequest(
+        input_ids,
+        max_new_tokens=max_new_tokens,
+        temperature=request.temperature,
+        top_p=request.top_p,
+        top_k=request.top_k,
+        repetition_penalty=engine.repetition_penalty,
+        priority=request.priority
+    )
+    generation_request.user_id = request.user_id
+    if request.response_format == "json":
+        # expected_output이 없으면 형식만 JSON 객체로 제한
+        generation_request.response_schema = question_response_schema(request.expected_output) if request.expected_output else {"type": "object"}
+        if json_constraint is not None:
+            generation_request.token_filter = json_constraint.token_filter(generation_request.response_schema)
+
+    # 시스템 메시지 구간은 요청 간에 공유되므로 prefix 캐시 대상으로 지정
+    system_text = tokenizer.apply_chat_template(messages[:1], tokenize=False)
+    system_ids = tokenizer(system_text).input_ids
+    if input_ids[:len(system_ids)] == system_ids:
+        generation_request.cache_prefix_len = len(system_ids)
+    return generation_request
+
+async def run_generation(request: PromptRequest, on_output=None):
+    """응답 캐시를 확인한 뒤 스케줄러로 생성하고 응답 딕셔너리를 반환
+
+    on_output(text, progress)는 새로 생성된 텍스트 조각마다 이벤트 루프에서 호출된다.
+    """
+    cache_key, cached = get_cached_response("generate", request)
+    if cached is not None:
+        if on_output:
+            on_output(cached["response"], 1.0)
+        return {**cached, "cached": True}
+
+    await llm_loader.get()
+    loop = asyncio.get_running_loop()
+    generation_request = await loop.run_in_executor(tokenize_executor, build_generation_request, request)
+    if on_output:
+        generation_request.on_text = lambda text: loop.call_soon_threadsafe(
+            on_output, text, len(generation_request.generated_ids) / generation_request.max_new_tokens
+        )
+    await scheduler.run(generation_request)
+    generated_tokens.observe(len(generation_request.generated_ids), priority=generation_request.priority)
+    if request.expected_output:
+        # 주기적으로 프로파일 파일을 쓰므로 이벤트 루프 밖에서 갱신
+        await loop.run_in_executor(tokenize_executor, partial(
+            output_budget.observe,
+            request.expected_output,
+            len(generation_request.generated_ids),
+            truncated=generation_request.finish_reason == "length",
+            response_format=request.response_format
+        ))
+
+    response = tokenizer.decode(generation_request.generated_ids, skip_special_tokens=True)
+    if request.response_format == "json":
+        record_structured_output(generation_request, response)
+    if cache_key is not None and generation_request.finish_reason == "stop":
+        response_cache.set(cache_key, {"response": response})
+    return {"response": response, "cached": False, **generation_request.stats()}
+
+def record_structured_output(generation_request, response):
+    """JSON 응답 요청의 제약 적용 여부와 파싱 성공 여부를 집계"""
+    structured_stats["requests"] += 1
+    structured_stats["constrained"] += generation_request.token_filter is not None
+    structured_stats["truncated"] += generation_request.finish_reason == "length"
+    try:
+        json.loads(response)
+        structured_stats["valid"] += 1
+    except ValueError:
+        print(f"JSON 응답을 읽을 수 없습니다 ({generation_request.finish_reason}, 토큰 {len(generation_request.generated_ids)}개)")
 
 @app.post("/generate")
 async def generate_response(request: PromptRequest):
+    async with generate_limiters[request.priority].admit():
+        try:
+            return await run_generation(request)
+        except GenerationCancelledError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ModelUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except PromptTooLongError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+def build_grading_request(request: PromptRequest):
+    """True/False 중 첫 토큰 하나만 고르는 채점용 요청 (탐욕적 선택, 반복 패널티 없음, 대화형 우선순위)"""
+    generation_request = build_generation_request(request)
+    generation_request.priority = PRIORITY_INTERACTIVE
+    generation_request.max_new_tokens = 1
+    generation_request.temperature = 0.0
+    generation_request.repetition_penalty = 1.0
+    generation_request.allowed_token_ids = list(GRADING_LABEL_TOKENS.values())
+    return generation_request
+
+def grading_result(generation_request):
+    """채점 요청의 선택 토큰과 True 확률로 응답 생성"""
+    label_by_token = {token_id: label for label, token_id in GRADING_LABEL_TOKENS.items()}
+    label = label_by_token[generation_request.generated_ids[0]]
+    score = generation_request.token_scores[GRADING_LABEL_TOKENS["True"]]
+    return {"response": label, "score": round(score, 4)}
+
+@app.post("/similarity")
+async def grade_similarity(request: PromptRequest):
+    """자유 생성 없이 True/False 첫 토큰의 logits만 비교하는 채점 엔드포인트"""
+    async with grading_limiter.admit():
+        try:
+            cache_key, cached = get_cached_response("similarity", request)
+            if cached is not None:
+                return {**cached, "cached": True}
+
+            await llm_loader.get()
+            generation_request = await asyncio.get_running_loop().run_in_executor(tokenize_executor, build_grading_request, request)
+            await scheduler.run(generation_request)
+            result = grading_result(generation_request)
+            if cache_key is not None:
+                response_cache.set(cache_key, result)
+            return {**result, "cached": False, **generation_request.stats()}
+        except GenerationCancelledError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ModelUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except PromptTooLongError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+class GradingItem(BaseModel):
+    user_answer: Optional[str] = None
+    correct_answer: str
+    question_type: str
+
+class GradingBatchRequest(BaseModel):
+    items: List[GradingItem]
+    user_id: Optional[Union[int, str]] = None
+
+def grading_prompt_request(item: GradingItem, user_id=None):
+    """/similarity 클라이언트(Frontend utils.check_answer)와 같은 채점 프롬프트로 요청 생성"""
+    prompt = (
+        f"You are an intelligent assistant that evaluates the similarity between two answers based on their meaning. "
+        f"Given a user's answer and the correct answer for a {item.question_type} question, determine if the user's answer is correct. "
+        f"If the user's answer is not exist, None or blank, please reply with 'False'.\n\n"
+        f"Please reply with 'True' if the user's answer is correct or really simillar to correct answer, otherwise reply with 'False'."
+    )
+    context = (
+        f"Correct answer: {item.correct_answer}\n"
+        f"User's answer: {item.user_answer}\n"
+    )
+    return PromptRequest(prompt=prompt, context=context, user_id=user_id)
+
+@app.post("/similarity_batch")
+async def grade_similarity_batch(request: GradingBatchRequest):
+    """답안지 전체를 한 번에 채점 (캐시되지 않은 문항은 하나의 prefill 배치로 처리)"""
+    async with grading_limiter.admit():
+        try:
+            await llm_loader.get()
+            results = [None] * len(request.items)
+            pending = []  # (문항 위치, 캐시 키, 채점 프롬프트 요청)
+            for i, item in enumerate(request.items):
+                # 빈 답안은 모델을 거치지 않고 오답 처리
+                if item.user_answer is None or not item.user_answer.strip():
+                    results[i] = {"response": "False", "score": 0.0, "cached": False}
+                    continue
+                prompt_request = grading_prompt_request(item, request.user_id)
+                cache_key, cached = get_cached_response("similarity", prompt_request)
+                if cached is not None:
+                    results[i] = {**cached, "cached": True}
+                    continue
+                pending.append((i, cache_key, prompt_request))
+
+            generation_requests = await asyncio.get_running_loop().run_in_executor(
+                tokenize_executor, lambda: [build_grading_request(prompt_request) for _, _, prompt_request in pending]
+            )
+            await scheduler.run_many(generation_requests)
+            for (i, cache_key, _), generation_request in zip(pending, generation_requests):
+                result = grading_result(generation_request)
+                if cache_key is not None:
+                    response_cache.set(cache_key, result)
+                results[i] = {**result, "cached": False}
+            return {"results": results, "graded": len(pending)}
+        except GenerationCancelledError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ModelUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except PromptTooLongError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+async def run_admitted(limiter, fn, *args, **kwargs):
+    """reserve()로 자리를 예약해 둔 작업을 실행 차례가 오면 실행"""
+    async with limiter.slot():
+        return await fn(*args, **kwargs)
+
+@app.post("/generate_stream")
+async def generate_stream(request: PromptRequest):
+    """생성되는 토큰을 Server-Sent Events로 즉시 전송"""
+    limiter = generate_limiters[request.priority]
+    limiter.reserve()
+    chunks = asyncio.Queue()
+    task = asyncio.create_task(run_admitted(limiter, run_generation, request, on_output=lambda text, progress: chunks.put_nowait(text)))
+    limiter.release_when_done(task)
+    # 스트리밍 조각이 모두 큐에 들어간 뒤에 완료 표시(None)가 들어감
+    task.add_done_callback(lambda _: chunks.put_nowait(None))
+
+    async def event_stream():
+        try:
+            while True:
+                text = await chunks.get()
+                if text is None:
+                    break
+                yield f"data: {json.dumps({'text': text})}\n\n"
+        finally:
+            # 클라이언트 연결이 끊기면 생성도 중단
+            if not task.done():
+                task.cancel()
+        try:
+            result = task.result()
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            return
+        stats = {key: value for key, value in result.items() if key != "response"}
+        yield f"event: done\ndata: {json.dumps(stats)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+def get_job_or_404(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+    return job
+
+@app.post("/jobs/generate")
+async def submit_generation_job(request: PromptRequest):
+    """생성 작업을 제출하고 바로 작업 id를 반환"""
+    limiter = generate_limiters[request.priority]
+    limiter.reserve()
+    job = job_store.create("generate", request.user_id)
+
+    def on_output(text, progress):
+        job.append_output(text)
+        job.set_progress(progress)
+
+    job_store.start(job, run_admitted(limiter, run_generation, request, on_output=on_output))
+    limiter.release_when_done(job.task)
+    return {"job_id": job.id, "status": job.status}
+
+def start_transcription_job(kind, user_id, path, media_sha256):
+    """저장된 업로드의 변환 작업을 시작 (transcribe_limiter 자리는 미리 예약되어 있어야 함)"""
+    job = job_store.create(kind, user_id)
+    job_store.start(job, run_admitted(transcribe_limiter, transcribe_saved_upload, job, path, media_sha256))
+    transcribe_limiter.release_when_done(job.task)
+    # 실행 차례가 오기 전에 취소되어도 임시 파일은 삭제
+    job.task.add_done_callback(lambda _: remove_file(path))
+    return job
+
+@app.post("/jobs/transcribe_video")
+async def submit_video_transcription_job(file: UploadFile = File(...), user_id: Optional[str] = Form(None)):
+    """업로드를 저장한 뒤 비디오 변환 작업을 제출하고 작업 id를 반환"""
+    transcribe_limiter.reserve()
     try:
-        messages = [
-            {"role": "system", "content": request.prompt},
-            {"role": "user", "content": request.context}
-        ]
-        text = tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
-        model_inputs = tokenizer([text], return_tensors="pt", padding=True, truncation=True).to(device)
-        generated_ids = model.generate(
-            model_inputs.input_ids,
-            max_new_tokens=16384,
-            top_k=50,
-            top_p=0.7,
-            temperature=0.3
-        )
-        generated_ids = [
-            output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
+        temp_mp4_path, media_sha256 = await save_upload(file, ".mp4")
+    except InputTooLargeError as e:
+        transcribe_limiter.release()
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        transcribe_limiter.release()
+        raise HTTPException(status_code=500, detail=str(e))
+    job = start_transcription_job("transcribe_video", user_id, temp_mp4_path, media_sha256)
+    return {"job_id": job.id, "status": job.status}
 
-        response = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return {"response": response}
+@app.post("/jobs/transcribe_audio")
+async def submit_audio_transcription_job(file: UploadFile = File(...), user_id: Optional[str] = Form(None)):
+    """업로드를 저장한 뒤 오디오 변환 작업을 제출하고 작업 id를 반환"""
+    transcribe_limiter.reserve()
+    try:
+        temp_audio_path, media_sha256 = await save_upload(file, ".wav")
+    except InputTooLargeError as e:
+        transcribe_limiter.release()
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
+        transcribe_limiter.release()
         raise HTTPException(status_code=500, detail=str(e))
+    job = start_transcription_job("transcribe_audio", user_id, temp_audio_path, media_sha256)
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, offset: int = 0):
+    """작업 상태, 진행률, offset 이후의 부분 결과 조회"""
+    return get_job_or_404(job_id).to_dict(offset)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """완료된 작업의 결과 조회 (진행 중이면 202)"""
+    job = get_job_or_404(job_id)
+    if job.status == "succeeded":
+        headers = {"X-Transcript-Cache": job.info["transcript_cache"]} if "transcript_cache" in job.info else None
+        return JSONResponse(content={"job_id": job.id, "status": job.status, "result": job.result}, headers=headers)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status == "cancelled":
+        raise HTTPException(status_code=409, detail="취소된 작업입니다.")
+    return JSONResponse(status_code=202, content=job.to_dict())
+
+class StopRequest(BaseModel):
+    job_id: Optional[str] = None
+    user_id: Optional[Union[int, str]] = None
+    all: bool = False  # 모든 사용자의 작업과 생성을 중단 (관리자용, 명시적으로 지정해야 함)
+
+@app.post("/emergency_stop")
+async def emergency_stop(request: Optional[StopRequest] = None):
+    """작업 하나, 사용자의 모든 작업, 또는 (all이면) 모든 생성을 즉시 중단"""
+    request = request or StopRequest()
+    if request.job_id is None and request.user_id is None and not request.all:
+        raise HTTPException(status_code=400, detail="job_id, user_id 또는 all 중 하나를 지정해야 합니다.")
+    if request.job_id is not None:
+        job = get_job_or_404(request.job_id)
+        cancelled_jobs = int(job_store.cancel(job))
+        return {"cancelled_jobs": cancelled_jobs, "cancelled_requests": 0}
+
+    cancelled_jobs = sum(job_store.cancel(job) for job in job_store.find(request.user_id))
+    if scheduler is None:
+        cancelled_requests = 0
+    elif request.user_id is None:
+        cancelled_requests = scheduler.cancel(lambda r: True)
+    else:
+        cancelled_requests = scheduler.cancel(lambda r: str(r.user_id) == str(request.user_id))
+    print(f"긴급 중단: 작업 {cancelled_jobs}개, 생성 요청 {cancelled_requests}개 취소")
+    return {"cancelled_jobs": cancelled_jobs, "cancelled_requests": cancelled_requests}
+
+@app.get("/stats")
+async def get_stats():
+    """스케줄러 처리량과 캐시 적중률 통계"""
+    stats = {"models": {"engine": engine.name, "llm": {**llm_loader.status(), "source": engine.load_source}, "whisper": transcriber_loader.status()}}
+    if scheduler is not None:
+        stats["scheduler"] = scheduler.stats()
+    if prefix_cache is not None:
+        stats["prefix_cache"] = prefix_cache.stats()
+    if response_cache is not None:
+        stats["response_cache"] = response_cache.stats()
+    if transcript_cache is not None:
+        stats["transcript_cache"] = transcript_cache.stats()
+    if vad_stats["files"]:
+        stats["vad"] = {
+            **{key: round(value, 1) for key, value in vad_stats.items()},
+            "kept_ratio": round(vad_stats["kept_seconds"] / vad_stats["input_seconds"], 3) if vad_stats["input_seconds"] else 0,
+        }
+    stats["admission"] = {limiter.name: limiter.stats() for limiter in (*generate_limiters.values(), grading_limiter, transcribe_limiter)}
+    stats["output_budget"] = output_budget.stats()
+    stats["input_truncation"] = {**input_truncation_stats, "max_input_tokens": MAX_INPUT_TOKENS}
+    stats["structured_output"] = {
+        **structured_stats,
+        "enforcer": json_constraint is not None,
+        "valid_ratio": round(structured_stats["valid"] / structured_stats["requests"], 3) if structured_stats["requests"] else None,
+    }
+    stats["jobs"] = job_store.stats()
+    return stats
+
+def collect_metrics():
+    """/metrics 요청마다 읽는 큐 길이, 토큰 처리량, 캐시 적중, 메모리 지표"""
+    yield "model_ready", "gauge", "모델 로드 완료 여부", [
+        ({"model": loader.name}, int(loader.ready)) for loader in (llm_loader, transcriber_loader)
+    ]
+    yield "admission_running", "gauge", "엔드포인트별 실행 중인 요청 수", [
+        ({"limiter": limiter.name}, limiter.running) for limiter in (*generate_limiters.values(), grading_limiter, transcribe_limiter)
+    ]
+    yield "admission_waiting", "gauge", "엔드포인트별 실행 차례를 기다리는 요청 수", [
+        ({"limiter": limiter.name}, limiter.pending - limiter.running) for limiter in (*generate_limiters.values(), grading_limiter, transcribe_limiter)
+    ]
+    yield "admission_rejected_total", "counter", "대기열이 가득 차 429로 거절한 요청 수", [
+        ({"limiter": limiter.name}, limiter.rejected) for limiter in (*generate_limiters.values(), grading_limiter, transcribe_limiter)
+    ]
+    yield "jobs", "gauge", "상태별 작업 수", [({"status": status}, count) for status, count in job_store.stats().items()]
+
+    if scheduler is not None:
+        stats = scheduler.stats()
+        yield "scheduler_waiting", "gauge", "우선순위별 스케줄러 대기 요청 수", [
+            ({"priority": priority}, count) for priority, count in stats["waiting_by_priority"].items()
+        ]
+        yield "scheduler_active", "gauge", "디코딩 배치에서 생성 중인 요청 수", [({}, stats["active"])]
+        yield "llm_prefill_tokens_total", "counter", "prefill한 프롬프트 토큰 수 (prefix 캐시 적중 구간 제외)", [({}, stats["prefill_tokens"])]
+        yield "llm_prefill_seconds_total", "counter", "prefill에 걸린 시간 (초)", [({}, stats["prefill_seconds"])]
+        yield "llm_decode_tokens_total", "counter", "디코딩한 토큰 수", [({}, stats["decode_tokens"])]
+        yield "llm_decode_seconds_total", "counter", "디코딩에 걸린 시간 (초)", [({}, stats["decode_seconds"])]
+        yield "llm_tokens_per_second", "gauge", "처리 중인 시간 기준 누적 토큰 처리량", [
+            ({"phase": "prefill"}, stats["prefill_tokens"] / stats["prefill_seconds"] if stats["prefill_seconds"] else 0.0),
+            ({"phase": "decode"}, stats["decode_tokens"] / stats["decode_seconds"] if stats["decode_seconds"] else 0.0),
+        ]
+        if stats.get("assisted"):
+            yield "llm_assisted_tokens_total", "counter", "assisted generation으로 생성한 토큰 수", [({}, stats["assisted"]["tokens"])]
+            yield "llm_assisted_acceptance_rate", "gauge", "초안 모델이 제안한 토큰 중 수락된 비율", [({}, stats["assisted"]["acceptance_rate"])]
+            yield "llm_assisted_tokens_per_second", "gauge", "assisted generation 처리량", [({}, stats["assisted"]["tokens_per_second"])]
+
+    yield "structured_output_total", "counter", "JSON 응답 요청 수와 JSON으로 읽을 수 있었던 응답 수", [
+        ({"result": "requested"}, structured_stats["requests"]),
+        ({"result": "valid"}, structured_stats["valid"]),
+    ]
+
+    processing_seconds = sum(value for _, _, value in transcribe_processing_seconds.samples())
+    audio_seconds = sum(value for _, _, value in transcribed_audio_seconds.samples())
+    yield "transcribe_audio_seconds_per_second", "gauge", "변환 시간 1초당 처리한 오디오 길이 (초)", [
+        ({}, audio_seconds / processing_seconds if processing_seconds else 0.0)
+    ]
+
+    cache_lookups = []
+    if response_cache is not None:
+        cache_lookups.append(("response", response_cache))
+    if transcript_cache is not None:
+        cache_lookups.append(("transcript", transcript_cache))
+    samples = []
+    for name, cache in cache_lookups:
+        samples += [
+            ({"cache": name, "result": "memory_hit"}, cache.memory_hits),
+            ({"cache": name, "result": "disk_hit"}, cache.disk_hits),
+            ({"cache": name, "result": "miss"}, cache.misses),
+        ]
+    if prefix_cache is not None:
+        samples += [
+            ({"cache": "prefix", "result": "hit"}, prefix_cache.hits),
+            ({"cache": "prefix", "result": "miss"}, prefix_cache.lookups - prefix_cache.hits),
+        ]
+    yield "cache_lookups_total", "counter", "캐시별 조회 결과 수", samples
+    if prefix_cache is not None:
+        yield "prefix_cache_bytes", "gauge", "prefix 캐시가 사용 중인 KV 메모리 (바이트)", [({}, prefix_cache.total_bytes)]
+
+    current_rss, peak_rss = process_memory()
+    if current_rss is not None:
+        yield "process_resident_memory_bytes", "gauge", "현재 프로세스 RSS (바이트)", [({}, current_rss)]
+    yield "process_peak_resident_memory_bytes", "gauge", "프로세스 최대 RSS (바이트)", [({}, peak_rss)]
+    if torch.cuda.is_available():
+        yield "gpu_peak_allocated_bytes", "gauge", "GPU 최대 할당 메모리 (바이트)", [({}, torch.cuda.max_memory_allocated())]
+
+metrics.add_collector(collect_metrics)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 텍스트 형식 지표"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # FastAPI 서버를 실행
 if __name__ == "__main__":
@@ -0,0 +1,596 @@
+# engines.py
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+import audio_processing
+from scheduler import BatchScheduler, GenerationCancelledError, LatencyStats, PRIORITIES, PRIORITY_BULK
+
+
+class TransformersEngine:
+    """4bit 양자화한 HF 모델과 연속 배칭 스케줄러로 생성하는 엔진
+
+    quantized_dir를 지정하면 처음 한 번 원본 가중치를 양자화한 결과를 safetensors로 저장해 두고,
+    이후 재시작부터는 그 디렉터리를 (메모리 매핑으로) 바로 읽어 다운로드와 재양자화를 건너뛴다.
+    draft_model_id를 지정하면 같은 토크나이저를 쓰는 작은 모델을 초안 모델로 올려 assisted generation에 사용한다.
+    """
+
+    name = "transformers"
+
+    def __init__(self, model_id, max_batch_size=8, max_prefill_batch_size=32, prefix_cache=None, warmup_tokens=0,
+                 interactive_slots=1, max_bulk_wait=30.0, quantized_dir=None, draft_model_id=None, num_assistant_tokens=5):
+        self.model_id = model_id
+        self.quantized_dir = quantized_dir
+        self.draft_model_id = draft_model_id
+        self.num_assistant_tokens = num_assistant_tokens
+        self.draft_model = None
+        self.load_source = None
+        self.max_batch_size = max_batch_size
+        self.max_prefill_batch_size = max_prefill_batch_size
+        self.prefix_cache = prefix_cache
+        self.interactive_slots = interactive_slots
+        self.max_bulk_wait = max_bulk_wait
+        self.warmup_tokens = warmup_tokens
+        self.model = None
+        self.tokenizer = None
+        self.scheduler = None
+        self.repetition_penalty = 1.0
+
+    def load(self):
+        self.model, self.tokenizer = self._load_model()
+        self.repetition_penalty = getattr(self.model.generation_config, "repetition_penalty", None) or 1.0
+
+        if self.warmup_tokens > 0:
+            # 짧은 더미 생성으로 커널 초기화 비용을 미리 치름
+            inputs = self.tokenizer("워밍업", return_tensors="pt").to(self.model.device)
+            with torch.inference_mode():
+                self.model.generate(**inputs, max_new_tokens=self.warmup_tokens, do_sample=False)
+
+        if self.draft_model_id:
+            self.draft_model = self._load_draft_model()
+            # 라운드마다 같은 수의 토큰을 제안하게 하여 수락률을 계산할 수 있게 함
+            self.draft_model.generation_config.num_assistant_tokens = self.num_assistant_tokens
+            self.draft_model.generation_config.num_assistant_tokens_schedule = "constant"
+            print(f"초안 모델 로드 완료: {self.draft_model_id} (라운드당 {self.num_assistant_tokens}개 제안)")
+
+        self.scheduler = BatchScheduler(
+            self.model,
+            self.tokenizer,
+            max_batch_size=self.max_batch_size,
+            max_prefill_batch_size=self.max_prefill_batch_size,
+            prefix_cache=self.prefix_cache,
+            interactive_slots=self.interactive_slots,
+            max_bulk_wait=self.max_bulk_wait,
+            assistant_model=self.draft_model
+        )
+        self.scheduler.start()
+        return self
+
+    def _load_draft_model(self):
+        from transformers import AutoModelForCausalLM
+
+        model = AutoModelForCausalLM.from_pretrained(self.draft_model_id, torch_dtype=torch.bfloat16)
+        return model.to(self.model.device).eval()
+
+    def _load_model(self):
+        from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+
+        if self.quantized_dir and os.path.exists(os.path.join(self.quantized_dir, "config.json")):
+            # 저장된 설정에 양자화 방식이 들어 있으므로 quantization_config 없이 그대로 읽음
+            self.load_source = "quantized_checkpoint"
+            print(f"저장된 양자화 체크포인트에서 로드: {self.quantized_dir}")
+            model = AutoModelForCausalLM.from_pretrained(
+                self.quantized_dir,
+                torch_dtype=torch.bfloat16,
+                device_map="auto",
+                use_safetensors=True
+            )
+            return model, AutoTokenizer.from_pretrained(self.quantized_dir)
+
+        quantization_config = BitsAndBytesConfig(
+            load_in_4bit=True,  # 4bit 양자화 활성화
+            llm_int8_enable_fp32_cpu_offload=False,  # CPU 오프로딩 비활성화 (GPU만 사용)
+            bnb_4bit_compute_dtype=torch.bfloat16,  # 4080 GPU에서 bfloat16을 사용하여 계산 최적화
+            bnb_4bit_quant_type="nf4",  # NF4 양자화 유형 사용 (FP4보다 높은 정확도와 안정성)
+            llm_int8_has_fp16_weight=True  # LLM.int8()과 함께 16-bit 가중치 사용 (백워드 패스 최적화)
+        )
+        self.load_source = "original"
+        model = AutoModelForCausalLM.from_pretrained(
+            self.model_id,
+            quantization_config=quantization_config,
+            torch_dtype="bfloat16",
+            device_map="auto"
+        )
+        tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+        if self.quantized_dir:
+            try:
+                self.export_quantized(model, tokenizer, self.quantized_dir)
+            except Exception as e:
+                # 저장에 실패해도 서버는 원본에서 로드한 모델로 계속 동작
+                print(f"양자화 체크포인트 저장 실패: {e}")
+        return model, tokenizer
+
+    @staticmethod
+    def export_quantized(model, tokenizer, path):
+        """양자화된 가중치와 토크나이저를 safetensors로 저장 (임시 디렉터리에 쓴 뒤 이름을 바꿔 중간 상태가 남지 않게 함)"""
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        started_at = time.perf_counter()
+        model.save_pretrained(temp_path, safe_serialization=True)
+        tokenizer.save_pretrained(temp_path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.replace(temp_path, path)
+        print(f"양자화 체크포인트 저장 완료: {path} ({time.perf_counter() - started_at:.1f}초)")
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+
+class CPUEngine(TransformersEngine):
+    """GPU가 없는 서버용 엔진: Linear 층을 int8 동적 양자화한 모델을 CPU에서 같은 스케줄러로 실행
+
+    가중치는 int8로 저장하고 활성값은 실행 시점에 양자화하므로 보정 데이터가 필요 없다.
+    CPU에서는 배치가 커질수록 스텝 시간도 거의 비례해 늘어나므로 max_batch_size는 작게 두는 것이 좋다.
+    """
+
+    name = "cpu"
+
+    def __init__(self, model_id, threads=None, quantize=True, **kwargs):
+        super().__init__(model_id, **kwargs)
+        self.threads = threads or os.cpu_count() or 1
+        self.quantize = quantize
+
+    def _load_model(self):
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        torch.set_num_threads(self.threads)
+        self.load_source = "original"
+        # 동적 양자화는 float32 Linear 가중치를 입력으로 받음
+        model = AutoModelForCausalLM.from_pretrained(self.model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        model.eval()
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f"CPU 엔진: 스레드 {self.threads}개, {'int8 동적 양자화' if self.quantize else 'float32'}")
+        return model, AutoTokenizer.from_pretrained(self.model_id)
+
+    def _load_draft_model(self):
+        from transformers import AutoModelForCausalLM
+
+        model = AutoModelForCausalLM.from_pretrained(self.draft_model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        model.eval()
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+
+class WhisperTranscriber:
+    """Whisper로 오디오/영상 파일을 텍스트로 변환
+
+    긴 오디오는 조용한 지점에서 chunk_seconds(최대 30초) 이하로 나눈 뒤,
+    GPU에서는 여러 구간의 mel을 묶어 한 번에 디코딩하고 CPU에서는 작업자 프로세스들이 나눠 변환한다.
+    """
+
+    name = "whisper"
+
+    def __init__(self, model_name, device, warmup=False, chunk_seconds=30.0, overlap_seconds=1.0,
+                 batch_size=8, workers=1, language=None):
+        self.model_name = model_name
+        self.device = device
+        self.warmup = warmup
+        self.chunk_seconds = min(chunk_seconds, 30.0)  # Whisper 입력 창 길이
+        self.overlap_seconds = overlap_seconds
+        self.batch_size = batch_size
+        self.workers = workers
+        self.language = language
+        self.model = None
+        self.pool = None
+
+    @property
+    def cache_id(self):
+        """변환 결과 캐시 키에 들어가는 모델 식별자"""
+        return f"whisper-{self.model_name}"
+
+    @property
+    def batched(self):
+        return self.device.type == "cuda"
+
+    def load(self):
+        import whisper
+
+        if self.batched or self.workers <= 1:
+            self.model = whisper.load_model(self.model_name).to(self.device)
+        else:
+            # 작업자마다 모델을 따로 올리고 코어를 나눠 씀 (CUDA/torch 상태를 물려받지 않도록 spawn 사용)
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            context = multiprocessing.get_context("spawn")
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=audio_processing.init_worker,
+                initargs=(self.model_name, threads, context.Barrier(self.workers) if self.warmup else None)
+            )
+        if self.warmup:
+            # 1초 길이의 무음으로 디코딩 경로를 한 번 실행
+            silence = np.zeros(audio_processing.SAMPLE_RATE, dtype=np.float32)
+            if self.pool is not None:
+                # spawn 풀은 작업이 들어올 때만 작업자를 띄우므로 작업자 수만큼 보내 모든 작업자가 지금 모델을 로드하게 함
+                futures = [self.pool.submit(audio_processing.warmup_worker, silence) for _ in range(self.workers)]
+                for future in futures:
+                    future.result()
+            else:
+                self.transcribe(silence)
+        return self
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def transcribe_file(self, path):
+        return self.transcribe(audio_processing.decode_audio_file(path))
+
+    def transcribe(self, audio):
+        """16kHz mono float32 오디오를 구간별로 변환하고 겹친 부분을 정리해 {"text", "segments"}로 반환"""
+        windows = audio_processing.split_on_silence(audio, self.chunk_seconds, overlap_seconds=self.overlap_seconds)
+        chunks = [(audio[start:end], start / audio_processing.SAMPLE_RATE) for start, end in windows]
+        if self.pool is not None:
+            futures = [self.pool.submit(audio_processing.transcribe_chunk, chunk, offset, self.language) for chunk, offset in chunks]
+            results = [future.result() for future in futures]
+        elif self.batched:
+            results = []
+            for i in range(0, len(chunks), self.batch_size):
+                results.extend(self._decode_batch(chunks[i:i + self.batch_size]))
+        else:
+            results = []
+            for chunk, offset in chunks:
+                result = self.model.transcribe(chunk, verbose=None, language=self.language, fp16=False)
+                results.append({"text": result["text"], "segments": audio_processing.offset_segments(result["segments"], offset)})
+        return audio_processing.stitch_transcripts(results)
+
+    def _decode_batch(self, chunks):
+        """30초 이하 구간들의 mel을 쌓아 whisper.decode 한 번으로 변환 (구간 단위 타임스탬프)"""
+        import whisper
+
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(chunk)), n_mels=self.model.dims.n_mels)
+            for chunk, _ in chunks
+        ]).to(self.model.device)
+        options = whisper.DecodingOptions(language=self.language, without_timestamps=True, fp16=True)
+        results = []
+        for (chunk, offset), decoded in zip(chunks, whisper.decode(self.model, mels, options)):
+            end = offset + len(chunk) / audio_processing.SAMPLE_RATE
+            segments = [{"start": round(offset, 2), "end": round(end, 2), "text": decoded.text.strip()}] if decoded.text.strip() else []
+            results.append({"text": decoded.text, "segments": segments})
+        return results
+
+
+# ---------------------------------------------------------------------------
+# GPU 없이 전체 흐름을 부하 테스트하기 위한 모의 엔진
+# ---------------------------------------------------------------------------
+
+MOCK_QUESTION_TYPES = ("multiple-choice", "short answer", "true/false", "fill-in-the-blank")
+MOCK_FALLBACK_WORDS = ["데이터", "알고리즘", "네트워크", "프로세스", "메모리", "함수", "변수", "구조"]
+MOCK_TRANSCRIPT = (
+    "오늘 강의에서는 운영체제의 프로세스와 스레드에 대해 알아보겠습니다. "
+    "프로세스는 실행 중인 프로그램이며 독립된 메모리 공간을 가집니다. "
+    "스레드는 프로세스 안에서 실행되는 흐름으로 메모리를 공유합니다. "
+    "스케줄러는 준비 큐에 있는 프로세스 중 하나를 골라 CPU를 할당합니다."
+)
+
+
+class MockTokenizer:
+    """공백 단위 조각을 토큰으로 쓰는 결정적 토크나이저 (HF 토크나이저에서 사용하는 메서드만 구현)"""
+
+    eos_token_id = 0
+    pad_token_id = 0
+    _PIECE = re.compile(r"\s*\S+|\s+")
+
+    def __init__(self):
+        self._pieces = ["<eos>"]
+        self._ids = {"<eos>": 0}
+        self._lock = threading.Lock()
+
+    def _token_id(self, piece):
+        with self._lock:
+            token_id = self._ids.get(piece)
+            if token_id is None:
+                token_id = self._ids[piece] = len(self._pieces)
+                self._pieces.append(piece)
+            return token_id
+
+    def encode(self, text, add_special_tokens=True):
+        return [self._token_id(piece) for piece in self._PIECE.findall(text)]
+
+    def __call__(self, text, truncation=False, return_tensors=None):
+        return SimpleNamespace(input_ids=self.encode(text))
+
+    def decode(self, token_ids, skip_special_tokens=False):
+        return "".join(
+            self._pieces[token_id] for token_id in token_ids
+            if not (skip_special_tokens and token_id == self.eos_token_id)
+        )
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "".join(f"<|{message['role']}|>\n{message['content']}\n" for message in messages)
+        if add_generation_prompt:
+            text += "<|assistant|>\n"
+        return self.encode(text) if tokenize else text
+
+
+def mock_questions(prompt_text, rng, schema=None):
+    """프롬프트에 적힌 유형별 문제 수만큼 프론트엔드 파서가 읽을 수 있는 형식의 문제를 생성
+
+    schema(JSON 응답 요청의 스키마)가 있으면 스키마의 유형별 문제 수만큼 JSON으로 생성한다.
+    """
+    counts = {}
+    if schema is not None:
+        counts = {question_type: prop.get("minItems", 0) for question_type, prop in schema.get("properties", {}).items()}
+    else:
+        for question_type, count in re.findall(r"(multiple-choice|short answer|true/false|fill-in-the-blank):\s*(\d+)", prompt_text):
+            counts[question_type] = int(count)
+    user_text = prompt_text.split("<|user|>", 1)[-1].split("<|assistant|>", 1)[0]
+    words = re.findall(r"[가-힣A-Za-z0-9]{2,}", user_text) or MOCK_FALLBACK_WORDS
+    if len(set(words)) < 4:
+        words = words + MOCK_FALLBACK_WORDS
+
+    items = {}
+    for question_type in MOCK_QUESTION_TYPES:
+        count = counts.get(question_type, 0)
+        if count <= 0:
+            continue
+        items[question_type] = []
+        for _ in range(count):
+            subject, *options = rng.sample(sorted(set(words)), 4)
+            if question_type == "multiple-choice":
+                answer = rng.choice("abcd")
+                options = options + [subject + "의 정의"]
+                rng.shuffle(options)
+                item = {"question": f"{subject}에 대한 설명으로 옳은 것은?", "options": options, "answer": answer}
+            elif question_type == "short answer":
+                item = {"question": f"{subject}와 가장 관련 있는 개념은 무엇인가?", "answer": options[0]}
+            elif question_type == "true/false":
+                item = {"question": f"{subject}는 {options[0]}와 관련이 있다.", "answer": rng.choice(["참", "거짓"])}
+            else:
+                item = {"question": f"{subject}는 ______ 와 함께 설명된다.", "answer": options[0]}
+            item["explanation"] = f"본문에서 {subject}와 {options[0]}를 함께 설명합니다."
+            items[question_type].append(item)
+    if schema is not None:
+        return json.dumps(items, ensure_ascii=False, indent=2)
+
+    blocks = []
+    for question_type, questions in items.items():
+        lines = [f"[{question_type.upper()}]", ""]
+        for n, item in enumerate(questions, 1):
+            lines += [f"문제 {n}. {item['question']}"]
+            if question_type == "multiple-choice":
+                lines += [f"{letter}) {option}" for letter, option in zip("abcd", item["options"])]
+                lines += ["", f"정답: {item['answer']}) {item['options']['abcd'.index(item['answer'])]}"]
+            else:
+                lines += ["", f"정답: {item['answer']}"]
+            lines += [f"해설: {item['explanation']}", ""]
+        blocks.append("\n".join(lines))
+    return "\n".join(blocks)
+
+
+def mock_grade(prompt_text):
+    """정답과 사용자 답을 정규화해 비교한 결정적 채점 결과와 True 확률"""
+    correct = re.search(r"Correct answer:\s*(.*)", prompt_text)
+    user = re.search(r"User's answer:\s*(.*)", prompt_text)
+    normalize = lambda match: re.sub(r"[\s.,!?'\"()]", "", match.group(1)).lower() if match else ""
+    correct, user = normalize(correct), normalize(user)
+    is_correct = bool(user) and user not in ("none", "null") and (user == correct or user in correct or correct in user)
+    return is_correct, 0.95 if is_correct else 0.05
+
+
+class MockScheduler:
+    """BatchScheduler와 같은 인터페이스로, 모델 없이 정해진 속도와 지연 분포로 토큰을 내보내는 스케줄러
+
+    첫 토큰 지연은 중앙값 latency_ms, 로그 표준편차 latency_sigma인 로그정규 분포를 따르고,
+    동시에 생성하는 요청은 max_batch_size개로, 그중 일괄 요청은 interactive_slots개를 뺀 수로 제한된다.
+    """
+
+    def __init__(self, tokenizer, max_batch_size=8, tokens_per_second=50.0, latency_ms=200.0, latency_sigma=0.5, seed=0,
+                 interactive_slots=1):
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.interactive_slots = min(interactive_slots, max_batch_size - 1)
+        self.tokens_per_second = tokens_per_second
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._slots = None
+        self._bulk_slots = None
+        self._waiting = []
+        self._active = []
+
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_steps = 0
+        self.total_step_rows = 0
+        self.total_queue_wait = 0.0
+        self.prefill_tokens = 0
+        self.prefill_seconds = 0.0
+        self.decode_tokens = 0
+        self.decode_seconds = 0.0
+        self.latency = LatencyStats()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    async def run(self, request):
+        return (await self.run_many([request]))[0]
+
+    async def run_many(self, requests):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_batch_size)
+            self._bulk_slots = asyncio.Semaphore(self.max_batch_size - self.interactive_slots)
+        submitted_at = time.perf_counter()
+        for request in requests:
+            request.submitted_at = submitted_at
+        return await asyncio.gather(*(self._run_one(request) for request in requests))
+
+    def cancel(self, predicate):
+        matched = [r for r in self._waiting + self._active if not r.cancelled and predicate(r)]
+        for request in matched:
+            request.cancelled = True
+        return len(matched)
+
+    async def _run_one(self, request):
+        self._waiting.append(request)
+        try:
+            # 채점처럼 한 토큰만 필요한 요청은 생성 자리를 기다리지 않음
+            if request.max_new_tokens == 1:
+                return await self._generate(request)
+            if request.priority == PRIORITY_BULK:
+                async with self._bulk_slots, self._slots:
+                    return await self._generate(request)
+            async with self._slots:
+                return await self._generate(request)
+        except (asyncio.CancelledError, GenerationCancelledError):
+            request.cancelled = True
+            self.cancelled += 1
+            raise
+        except Exception as e:
+            request.error = e
+            self.failed += 1
+            raise
+        finally:
+            if request in self._waiting:
+                self._waiting.remove(request)
+            if request in self._active:
+                self._active.remove(request)
+            request.finished_at = time.perf_counter()
+
+    async def _generate(self, request):
+        self._waiting.remove(request)
+        self._active.append(request)
+        request.started_at = time.perf_counter()
+        self.total_queue_wait += request.queue_wait
+        prompt_text = self.tokenizer.decode(request.input_ids)
+        if self.latency_ms > 0:
+            await asyncio.sleep(self._random.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma))
+        self.prefill_tokens += len(request.input_ids)
+        self.prefill_seconds += time.perf_counter() - request.started_at
+        decode_started_at = time.perf_counter()
+
+        if request.allowed_token_ids:
+            is_correct, score = mock_grade(prompt_text)
+            labels = {self.tokenizer.decode([token_id]).strip(): token_id for token_id in request.allowed_token_ids}
+            request.token_scores = {labels["True"]: score, labels["False"]: 1 - score}
+            token_ids = [labels["True" if is_correct else "False"]]
+        else:
+            seed = int.from_bytes(hashlib.sha256(f"{self.seed}:{prompt_text}".encode("utf-8")).digest()[:8], "big")
+            token_ids = self.tokenizer.encode(mock_questions(prompt_text, random.Random(seed), request.response_schema))
+
+        interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for token_id in token_ids[:request.max_new_tokens]:
+            if request.cancelled:
+                raise GenerationCancelledError("생성이 중단되었습니다.")
+            request.generated_ids.append(token_id)
+            request.steps += 1
+            request.batch_size_sum += len(self._active)
+            request.max_batch_size = max(request.max_batch_size, len(self._active))
+            self.total_steps += 1
+            self.total_step_rows += len(self._active)
+            if request.on_text:
+                request.on_text(self.tokenizer.decode([token_id]))
+            if interval:
+                await asyncio.sleep(interval)
+
+        request.finish_reason = "length" if len(token_ids) > request.max_new_tokens else "stop"
+        request.finished_at = time.perf_counter()
+        self.decode_tokens += len(request.generated_ids)
+        self.decode_seconds += request.finished_at - decode_started_at
+        self.completed += 1
+        self.latency.record(request)
+        return request
+
+    def stats(self):
+        return {
+            "engine": "mock",
+            "waiting": len(self._waiting),
+            "waiting_by_priority": {priority: sum(1 for r in self._waiting if r.priority == priority) for priority in PRIORITIES},
+            "active": len(self._active),
+            "max_batch_size": self.max_batch_size,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "steps": self.total_steps,
+            "mean_batch_size": round(self.total_step_rows / self.total_steps, 2) if self.total_steps else 0,
+            "mean_queue_wait_ms": round(self.total_queue_wait / self.completed * 1000, 1) if self.completed else 0,
+            "prefill_tokens": self.prefill_tokens,
+            "prefill_seconds": round(self.prefill_seconds, 3),
+            "decode_tokens": self.decode_tokens,
+            "decode_seconds": round(self.decode_seconds, 3),
+            "priorities": self.latency.stats(),
+        }
+
+
+class MockEngine:
+    """모의 토크나이저와 스케줄러로 구성된 엔진 (GPU와 모델 가중치 불필요)"""
+
+    name = "mock"
+    load_source = None
+
+    def __init__(self, max_batch_size=8, tokens_per_second=50.0, latency_ms=200.0, latency_sigma=0.5, seed=0,
+                 interactive_slots=1):
+        self.model_id = "mock"
+        self.tokenizer = MockTokenizer()
+        self.repetition_penalty = 1.0
+        self.scheduler = MockScheduler(
+            self.tokenizer,
+            max_batch_size=max_batch_size,
+            tokens_per_second=tokens_per_second,
+            latency_ms=latency_ms,
+            latency_sigma=latency_sigma,
+            seed=seed,
+            interactive_slots=interactive_slots
+        )
+
+    def load(self):
+        return self
+
+    def stop(self):
+        pass
+
+
+class MockTranscriber:
+    """파일 내용과 무관하게 고정된 강의 텍스트를 일정 지연 후 반환"""
+
+    name = "mock"
+
+    cache_id = "mock"
+
+    def __init__(self, latency_ms=1000.0):
+        self.latency_ms = latency_ms
+
+    def load(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def transcribe_file(self, path):
+        return self.transcribe(None)
+
+    def transcribe(self, audio):
+        time.sleep(self.latency_ms / 1000)
+        return {"text": MOCK_TRANSCRIPT, "segments": [{"start": 0.0, "end": 0.0, "text": MOCK_TRANSCRIPT}]}
@@ -0,0 +1,116 @@
+# jobs.py
+import asyncio
+import time
+import uuid
+
+from scheduler import GenerationCancelledError
+
+
+class Job:
+    """오래 걸리는 생성/변환 작업의 상태, 진행률, 부분 결과"""
+
+    def __init__(self, kind, user_id=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.status = "queued"  # queued, running, succeeded, failed, cancelled
+        self.progress = 0.0
+        self.partial_output = ""
+        self.result = None
+        self.error = None
+        self.info = {}  # 결과와 함께 알려줄 부가 정보 (변환 캐시 적중 여부 등)
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.task = None
+
+    @property
+    def finished(self):
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def set_progress(self, progress):
+        self.progress = max(self.progress, min(progress, 1.0))
+        self.updated_at = time.time()
+
+    def append_output(self, text):
+        self.partial_output += text
+        self.updated_at = time.time()
+
+    def to_dict(self, offset=0):
+        """상태 조회 응답 (offset 이후의 부분 결과만 포함)"""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "partial_output": self.partial_output[offset:],
+            "output_length": len(self.partial_output),
+            "error": self.error,
+            "info": self.info,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobStore:
+    """작업 테이블. 끝난 작업은 ttl초가 지나면 정리됨"""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._jobs = {}
+
+    def create(self, kind, user_id=None):
+        self.purge_expired()
+        job = Job(kind, user_id)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def find(self, user_id=None):
+        """진행 중인 작업 목록 (user_id가 주어지면 해당 사용자의 작업만)"""
+        return [
+            job for job in self._jobs.values()
+            if not job.finished and (user_id is None or str(job.user_id) == str(user_id))
+        ]
+
+    def cancel(self, job):
+        """작업을 취소 (생성 작업은 스케줄러 요청까지 취소가 전파됨)"""
+        if job.finished or job.task is None:
+            return False
+        job.task.cancel()
+        job.status = "cancelled"
+        job.updated_at = time.time()
+        return True
+
+    def start(self, job, coro):
+        """코루틴을 백그라운드 작업으로 실행하고 결과를 job에 기록"""
+        async def runner():
+            job.status = "running"
+            job.updated_at = time.time()
+            try:
+                job.result = await coro
+                job.status = "succeeded"
+                job.progress = 1.0
+            except (asyncio.CancelledError, GenerationCancelledError):
+                job.status = "cancelled"
+            except Exception as e:
+                print(f"작업 {job.id} 실패: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            job.updated_at = time.time()
+
+        job.task = asyncio.create_task(runner())
+        return job
+
+    def purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and now - job.updated_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
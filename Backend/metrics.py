@@ -0,0 +1,134 @@
+# metrics.py
+import bisect
+import os
+import resource
+import threading
+
+# 요청 처리 시간 히스토그램 구간 (초)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# 요청당 생성 토큰 수 히스토그램 구간
+TOKEN_BUCKETS = (1, 8, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """라벨 조합별로 누적되는 카운터"""
+
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """라벨 조합별 관측값 분포 (Prometheus 누적 구간 형식)"""
+
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # 라벨 -> [구간별 개수, 합계, 개수]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            values = list(self._values.items())
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels + (("le", format_value(float(bound))),), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """카운터와 히스토그램, 그리고 수집 시점에 값을 읽는 게이지를 Prometheus 텍스트 형식으로 내보냄
+
+    add_collector(fn)로 등록한 함수는 /metrics 요청마다 호출되어
+    (이름, 종류, 설명, [(라벨 딕셔너리, 값)]) 목록을 반환한다.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(sorted(labels.items()))} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def process_memory():
+    """(현재 RSS, 최대 RSS) 바이트"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Linux에서는 KB 단위
+    current = None
+    try:
+        with open("/proc/self/statm") as statm:
+            current = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    return current, peak
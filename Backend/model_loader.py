@@ -0,0 +1,80 @@
+# model_loader.py
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+
+class ModelUnavailableError(Exception):
+    """모델이 비활성화되었거나 로드에 실패하여 요청을 처리할 수 없음"""
+
+
+class ModelLoader:
+    """모델을 백그라운드 스레드에서 한 번만 로드하고, 로드가 끝날 때까지 기다릴 수 있게 하는 래퍼
+
+    start()를 여러 번 호출하거나 여러 요청이 동시에 get()을 기다려도 로드는 한 번만 실행된다.
+    """
+
+    def __init__(self, name, load_fn, enabled=True):
+        self.name = name
+        self.load_fn = load_fn
+        self.enabled = enabled
+        self._future = None
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.load_seconds = None
+
+    def start(self):
+        """로드를 시작 (이미 시작했으면 진행 중인 로드를 반환)"""
+        with self._lock:
+            if self._future is None:
+                self._future = Future()
+                self.started_at = time.perf_counter()
+                threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True).start()
+            return self._future
+
+    def _load(self):
+        print(f"{self.name} 모델 로딩 중...")
+        try:
+            value = self.load_fn()
+        except Exception as e:
+            print(f"{self.name} 모델 로딩 실패: {e}")
+            self._future.set_exception(e)
+            return
+        self.load_seconds = time.perf_counter() - self.started_at
+        print(f"{self.name} 모델 로딩 완료 ({self.load_seconds:.1f}초)")
+        self._future.set_result(value)
+
+    async def get(self):
+        """로드된 값을 반환 (아직 시작하지 않았으면 지금 로드를 시작하고 기다림)"""
+        if not self.enabled:
+            raise ModelUnavailableError(f"{self.name} 모델이 비활성화되어 있습니다.")
+        try:
+            # 기다리던 요청이 취소되어도 공유하는 로드 작업은 취소되지 않도록 shield로 감쌈
+            return await asyncio.shield(asyncio.wrap_future(self.start()))
+        except ModelUnavailableError:
+            raise
+        except Exception as e:
+            raise ModelUnavailableError(f"{self.name} 모델을 로드하지 못했습니다: {e}") from e
+
+    @property
+    def state(self):
+        if not self.enabled:
+            return "disabled"
+        if self._future is None:
+            return "not_loaded"
+        if not self._future.done():
+            return "loading"
+        return "failed" if self._future.exception() is not None else "ready"
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def status(self):
+        status = {"state": self.state}
+        if self.load_seconds is not None:
+            status["load_seconds"] = round(self.load_seconds, 1)
+        if self.state == "failed":
+            status["error"] = str(self._future.exception())
+        return status
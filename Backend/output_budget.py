@@ -0,0 +1,140 @@
+# output_budget.py
+import json
+import math
+import os
+import threading
+import time
+
+# 측정값이 쌓이기 전에 사용하는 문제 유형별 문제 하나당 토큰 수 (문제 + 정답 + 해설)
+DEFAULT_TOKENS_PER_QUESTION = {
+    "multiple-choice": 160,
+    "short answer": 90,
+    "true/false": 60,
+    "fill-in-the-blank": 80,
+}
+FALLBACK_TOKENS_PER_QUESTION = 120
+# JSON 응답은 키 이름과 따옴표, 괄호 때문에 같은 문제도 텍스트 형식보다 토큰이 많이 듦 (측정 전 기본값에 곱하는 배율)
+DEFAULT_FORMAT_FACTORS = {"text": 1.0, "json": 1.5}
+
+
+def profile_key(question_type, response_format="text"):
+    """출력 형식별로 따로 측정하는 프로파일 키 (텍스트 형식은 기존 저장 파일과 호환되도록 유형 이름 그대로)"""
+    return question_type if response_format == "text" else f"{response_format}:{question_type}"
+
+
+class OutputBudget:
+    """요청한 문제 수로 생성 토큰 한도를 정하고, 실제 출력 길이로 유형별 문제당 토큰 수를 갱신
+
+    (출력 형식, 유형)별 추정치는 지수 이동 평균으로 갱신되며 path의 JSON 파일에 저장되어 재시작 후에도 유지된다.
+    파일은 요청마다 쓰지 않고 save_interval초에 한 번만 쓰며, 남은 변경은 종료 시 flush()로 저장한다.
+    """
+
+    def __init__(self, path, max_tokens, overhead_tokens=64, margin=1.5, alpha=0.2, save_interval=30.0):
+        self.path = path
+        self.max_tokens = max_tokens
+        self.overhead_tokens = overhead_tokens
+        self.margin = margin
+        self.alpha = alpha
+        self.tokens_per_question = dict(DEFAULT_TOKENS_PER_QUESTION)
+        self.samples = {}
+        self.truncated = 0
+        self.save_interval = save_interval
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                saved = json.load(file)
+            self.tokens_per_question.update(saved.get("tokens_per_question", {}))
+            self.samples.update(saved.get("samples", {}))
+        except (OSError, ValueError) as e:
+            print(f"출력 길이 프로파일을 읽지 못했습니다: {e}")
+
+    def _save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {"tokens_per_question": dict(self.tokens_per_question), "samples": dict(self.samples)}
+            self._dirty = False
+            self._last_save = time.monotonic()
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+    def _tokens_per_question(self, question_type, response_format):
+        key = profile_key(question_type, response_format)
+        if key in self.tokens_per_question:
+            return self.tokens_per_question[key]
+        default = DEFAULT_TOKENS_PER_QUESTION.get(question_type, FALLBACK_TOKENS_PER_QUESTION)
+        return default * DEFAULT_FORMAT_FACTORS.get(response_format, 1.0)
+
+    def estimate(self, expected_output, response_format="text"):
+        """유형별 문제 수에 대한 예상 출력 토큰 수 (고정 오버헤드 제외)"""
+        return sum(
+            count * self._tokens_per_question(question_type, response_format)
+            for question_type, count in expected_output.items() if count > 0
+        )
+
+    def budget(self, expected_output, response_format="text"):
+        """생성 토큰 한도 = 오버헤드 + 예상 토큰 수 x 여유 배율 (max_tokens 이하)"""
+        with self._lock:
+            tokens = self.overhead_tokens + math.ceil(self.estimate(expected_output, response_format) * self.margin)
+        return max(1, min(tokens, self.max_tokens))
+
+    def observe(self, expected_output, generated_tokens, truncated=False, response_format="text"):
+        """생성된 토큰 수로 요청에 포함된 유형들의 문제당 토큰 수를 갱신
+
+        여러 유형이 섞인 요청은 유형별 길이를 나눌 수 없으므로, 예상 대비 실제 비율을 각 유형에 똑같이 적용한다.
+        """
+        with self._lock:
+            if not self._update(expected_output, generated_tokens, truncated, response_format):
+                return
+            due = time.monotonic() - self._last_save >= self.save_interval
+        if due:
+            self.flush()
+
+    def _update(self, expected_output, generated_tokens, truncated, response_format):
+        predicted = self.estimate(expected_output, response_format)
+        if predicted <= 0:
+            return False
+        ratio = max(generated_tokens - self.overhead_tokens, 0) / predicted
+        if truncated:
+            # 한도에 걸려 잘린 출력은 실제보다 짧게 측정되므로 최소한 여유 배율만큼 늘림
+            self.truncated += 1
+            ratio = max(ratio, self.margin)
+        for question_type, count in expected_output.items():
+            if count <= 0:
+                continue
+            key = profile_key(question_type, response_format)
+            current = self._tokens_per_question(question_type, response_format)
+            self.tokens_per_question[key] = round((1 - self.alpha) * current + self.alpha * current * ratio, 2)
+            self.samples[key] = self.samples.get(key, 0) + 1
+        self._dirty = True
+        return True
+
+    def flush(self):
+        """아직 파일에 쓰지 않은 추정치를 저장 (임시 파일에 쓴 뒤 교체하므로 도중에 죽어도 기존 파일은 온전함)"""
+        try:
+            self._save()
+        except OSError as e:
+            print(f"출력 길이 프로파일을 저장하지 못했습니다: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokens_per_question": dict(self.tokens_per_question),
+                "samples": dict(self.samples),
+                "truncated": self.truncated,
+                "margin": self.margin,
+            }
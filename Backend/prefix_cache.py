@@ -0,0 +1,123 @@
+# prefix_cache.py
+from collections import OrderedDict
+
+
+def block_hashes(token_ids, block_size, limit):
+    """token_ids의 block_size 단위 prefix마다 누적 해시를 계산 (limit 토큰까지)"""
+    hashes = []
+    current = 0
+    for end in range(block_size, limit + 1, block_size):
+        current = hash((current, tuple(token_ids[end - block_size:end])))
+        hashes.append((end, current))
+    return hashes
+
+
+def cache_nbytes(past_key_values):
+    return sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in past_key_values)
+
+
+class PrefixCacheEntry:
+    def __init__(self, token_ids, past_key_values, hashes):
+        self.token_ids = tuple(token_ids)
+        self.past_key_values = past_key_values
+        self.hashes = [block_hash for _, block_hash in hashes]
+        self.nbytes = cache_nbytes(past_key_values)
+
+
+class PrefixCache:
+    """최근 사용한 프롬프트 prefix의 prefill KV 상태를 보관하는 LRU 캐시
+
+    prefix는 block_size 토큰 단위의 누적 해시로 색인되므로, 뒷부분만 다른
+    프롬프트도 앞쪽의 공통 블록까지는 저장된 KV 상태를 재사용할 수 있다.
+    """
+
+    def __init__(self, max_bytes, block_size=64):
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._entries = OrderedDict()  # 마지막 블록 해시 -> PrefixCacheEntry
+        self._index = {}  # 블록 해시 -> 해당 블록을 포함하는 항목 키 집합
+        self.total_bytes = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.saved_tokens = 0
+        self.evictions = 0
+
+    def lookup(self, token_ids):
+        """공유 prefix가 가장 긴 항목을 찾아 (prefix 길이, 잘라낸 KV 상태)를 반환"""
+        self.lookups += 1
+        # 마지막 토큰은 logits 계산을 위해 항상 새로 prefill해야 함
+        for end, block_hash in reversed(block_hashes(token_ids, self.block_size, len(token_ids) - 1)):
+            keys = self._index.get(block_hash)
+            if not keys:
+                continue
+            key = next(iter(keys))
+            entry = self._entries[key]
+            if entry.token_ids[:end] != tuple(token_ids[:end]):
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_tokens += end
+            past_key_values = entry.past_key_values
+            if end < len(entry.token_ids):
+                past_key_values = tuple((k[:, :, :end], v[:, :, :end]) for k, v in past_key_values)
+            return end, past_key_values
+        return 0, None
+
+    def aligned_length(self, length):
+        """저장 가능한 prefix 길이 (block_size의 배수로 내림)"""
+        return length // self.block_size * self.block_size
+
+    def contains(self, token_ids):
+        """token_ids 전체를 prefix로 갖는 항목이 이미 있는지 확인 (있으면 최근 사용으로 갱신)"""
+        hashes = block_hashes(token_ids, self.block_size, len(token_ids))
+        if not hashes or hashes[-1][1] not in self._entries:
+            return False
+        self._entries.move_to_end(hashes[-1][1])
+        return True
+
+    def store(self, token_ids, past_key_values):
+        """block_size 배수 길이의 prefix KV 상태를 저장
+
+        past_key_values는 배치 크기 1이며, 배치 텐서와 저장소를 공유하지 않는 복사본이어야 한다.
+        """
+        hashes = block_hashes(token_ids, self.block_size, len(token_ids))
+        if not hashes or hashes[-1][0] != len(token_ids):
+            return
+        key = hashes[-1][1]
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+
+        entry = PrefixCacheEntry(token_ids, past_key_values, hashes)
+        if entry.nbytes > self.max_bytes:
+            return
+        while self._entries and self.total_bytes + entry.nbytes > self.max_bytes:
+            self._evict()
+
+        self._entries[key] = entry
+        self.total_bytes += entry.nbytes
+        for block_hash in entry.hashes:
+            self._index.setdefault(block_hash, set()).add(key)
+
+    def _evict(self):
+        key, entry = self._entries.popitem(last=False)
+        self.total_bytes -= entry.nbytes
+        self.evictions += 1
+        for block_hash in entry.hashes:
+            keys = self._index.get(block_hash)
+            keys.discard(key)
+            if not keys:
+                del self._index[block_hash]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0,
+            "prefill_tokens_saved": self.saved_tokens,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,165 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """줄바꿈과 앞뒤 공백만 다른 요청이 같은 키를 갖도록 정규화"""
+    return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").strip().split("\n"))
+
+
+def request_cache_key(payload):
+    """정규화한 요청 내용(JSON)의 SHA-256 해시"""
+    normalized = {key: normalize_text(value) if isinstance(value, str) else value for key, value in payload.items()}
+    encoded = json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class MemoryCache:
+    """항목별 만료 시각과 최대 항목 수를 갖는 메모리 LRU 캐시"""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()  # key -> (만료 시각, 값)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskCache:
+    """SQLite 파일에 값을 보관하는 영구 캐시 (항목별 만료 시각, 전체 크기 제한)"""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """(값, 만료 시각)을 반환하고 없거나 만료되었으면 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value), expires_at
+
+    def set(self, key, value, expires_at):
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, size, expires_at, now)
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """전체 크기가 한도를 넘으면 가장 오래 사용하지 않은 항목부터 삭제 (호출 시 self._lock 보유)"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+
+class ResponseCache:
+    """메모리 LRU와 디스크 저장소로 구성된 2단계 응답 캐시"""
+
+    def __init__(self, path, memory_items=1024, max_bytes=512 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.ttl = ttl
+        self.memory = MemoryCache(memory_items)
+        self.disk = DiskCache(path, max_bytes)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        item = self.disk.get(key)
+        if item is not None:
+            self.disk_hits += 1
+            # 디스크에서 찾은 항목은 만료 시각을 유지한 채 메모리 계층으로 올림
+            value, expires_at = item
+            self.memory.set(key, value, expires_at)
+            return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, value, expires_at)
+        self.disk.set(key, value, expires_at)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self.memory),
+            "disk": self.disk.stats(),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0,
+        }
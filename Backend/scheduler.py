@@ -0,0 +1,834 @@
+# scheduler.py
+import asyncio
+import threading
+import time
+from collections import deque
+
+import torch
+import torch.nn.functional as F
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # 구버전 transformers는 튜플 형태의 캐시만 사용
+    DynamicCache = None
+
+
+# 스케줄러는 배치 행 선택, 왼쪽 패딩, prefix 캐시 저장을 (key, value) 튜플 캐시로 처리하므로
+# from_legacy_cache/to_legacy_cache가 있는 transformers 4.x가 필요함 (requirements.txt에서 5 미만으로 고정)
+def to_model_cache(past_key_values):
+    """(key, value) 튜플 캐시를 모델 입력 형식으로 변환"""
+    if past_key_values is None or DynamicCache is None:
+        return past_key_values
+    return DynamicCache.from_legacy_cache(past_key_values)
+
+
+def to_legacy_cache(past_key_values):
+    """모델 출력 캐시를 (key, value) 튜플 형식으로 변환"""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def select_cache_rows(past_key_values, index):
+    """캐시에서 index에 해당하는 배치 행만 남김"""
+    return tuple((k.index_select(0, index), v.index_select(0, index)) for k, v in past_key_values)
+
+
+def left_pad_cache(past_key_values, attention_mask, length):
+    """캐시와 어텐션 마스크의 시퀀스 축을 왼쪽으로 패딩하여 length에 맞춤"""
+    pad = length - attention_mask.shape[1]
+    if pad <= 0:
+        return past_key_values, attention_mask
+    padded = tuple((F.pad(k, (0, 0, pad, 0)), F.pad(v, (0, 0, pad, 0))) for k, v in past_key_values)
+    return padded, F.pad(attention_mask, (pad, 0))
+
+
+def collect_eos_token_ids(model, tokenizer):
+    """생성 설정과 토크나이저에서 종료 토큰 id를 모음"""
+    eos_token_ids = set()
+    config_eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+    if isinstance(config_eos, int):
+        eos_token_ids.add(config_eos)
+    elif config_eos:
+        eos_token_ids.update(config_eos)
+    if tokenizer.eos_token_id is not None:
+        eos_token_ids.add(tokenizer.eos_token_id)
+    return eos_token_ids
+
+
+# 요청 우선순위 클래스: 학생이 기다리는 채점 같은 대화형 요청과 문제 생성 같은 일괄 요청
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+
+class GenerationCancelledError(Exception):
+    """중단 요청으로 생성이 취소된 경우"""
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LatencyStats:
+    """우선순위 클래스별로 최근 window개 요청의 대기 시간과 전체 지연 분포를 기록"""
+
+    def __init__(self, window=1000):
+        self.completed = {priority: 0 for priority in PRIORITIES}
+        self._samples = {priority: deque(maxlen=window) for priority in PRIORITIES}
+
+    def record(self, request):
+        if request.submitted_at is None or request.finished_at is None:
+            return
+        self.completed[request.priority] += 1
+        self._samples[request.priority].append((request.queue_wait, request.finished_at - request.submitted_at))
+
+    def stats(self):
+        stats = {}
+        for priority, samples in self._samples.items():
+            samples = list(samples)
+            stats[priority] = {"completed": self.completed[priority]}
+            if not samples:
+                continue
+            for name, values in (("queue_wait_ms", [wait for wait, _ in samples]), ("latency_ms", [latency for _, latency in samples])):
+                values.sort()
+                stats[priority][name] = {f"p{int(q * 100)}": round(percentile(values, q) * 1000, 1) for q in (0.5, 0.95, 0.99)}
+        return stats
+
+
+def _resolve_future(future, request, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(request)
+
+
+class GenerationRequest:
+    """스케줄러가 처리하는 단일 생성 요청"""
+
+    def __init__(self, input_ids, max_new_tokens, temperature=0.3, top_p=0.7, top_k=50, repetition_penalty=1.0,
+                 priority=PRIORITY_BULK):
+        self.input_ids = list(input_ids)
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.repetition_penalty = repetition_penalty
+        self.user_id = None
+        self.priority = priority
+        # 지정하면 이 토큰들 중에서만 선택하고, 첫 스텝의 토큰별 확률을 token_scores에 기록
+        self.allowed_token_ids = None
+        self.token_scores = None
+        # 지정하면 (프롬프트 + 생성 토큰) 목록을 받아 다음에 허용할 토큰 id 목록을 반환 (JSON 스키마 제약 등)
+        self.token_filter = None
+        # JSON 응답 요청의 스키마 (모의 엔진은 이 스키마 형식으로 응답)
+        self.response_schema = None
+        # 중단 요청 시 True가 되며, 워커가 다음 디코딩 스텝 전에 배치에서 제거함
+        self.cancelled = False
+        # 공유 prefix 캐시에 저장할 앞부분 길이 (시스템 프롬프트 구간)
+        self.cache_prefix_len = 0
+        self.cached_tokens = 0
+        self.generated_ids = []
+        self.finish_reason = None
+        self.error = None
+
+        # 스트리밍 요청이면 새로 디코딩된 텍스트 조각을 워커 스레드에서 전달받음
+        self.on_text = None
+        self._stream_token_offset = 0
+        self._stream_text_offset = 0
+
+        # 요청별 통계
+        self.submitted_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.steps = 0
+        self.batch_size_sum = 0
+        self.max_batch_size = 0
+
+        self._loop = None
+        self._future = None
+        self._seen_ids = None
+        self._seen_tensor = None
+
+    @property
+    def do_sample(self):
+        return self.temperature > 0
+
+    @property
+    def queue_wait(self):
+        if self.started_at is None or self.submitted_at is None:
+            return 0.0
+        return self.started_at - self.submitted_at
+
+    def record_step(self, batch_size):
+        self.steps += 1
+        self.batch_size_sum += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+
+    def stats(self):
+        """요청별 대기 시간과 배치 크기 통계"""
+        generation_time = (self.finished_at - self.started_at) if self.finished_at and self.started_at else 0.0
+        return {
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "generation_ms": round(generation_time * 1000, 1),
+            "mean_batch_size": round(self.batch_size_sum / self.steps, 2) if self.steps else 0,
+            "max_batch_size": self.max_batch_size,
+            "cached_prefix_tokens": self.cached_tokens,
+            "new_tokens": len(self.generated_ids),
+        }
+
+
+class AssistedProgress:
+    """assisted generation의 진행 상황을 요청에 반영하는 streamer 겸 stopping criteria
+
+    generate()는 streamer.put()에 프롬프트를 한 번 넘긴 뒤 검증 라운드마다 대상 모델이 확정한 토큰만 넘기므로,
+    생성 토큰 반영과 스트리밍은 put()에서만 한다. stopping criteria는 라운드마다 초안 후보(검증 전)와
+    확정된 시퀀스에 대해 두 번 호출되며, 확정 길이보다 긴 입력이면 초안이 제안한 토큰 수를 기록한다.
+    요청이 취소되었거나 다른 요청이 대기열에 들어오면 생성을 멈추게 한다.
+    """
+
+    def __init__(self, scheduler, request, eos_token_ids):
+        self.scheduler = scheduler
+        self.request = request
+        self.eos_token_ids = eos_token_ids
+        self.verified_length = None
+        self.rounds = 0
+        self.proposed = 0
+        self.accepted = 0
+        self._candidate_tokens = 0
+        self._finished = False
+
+    def put(self, value):
+        tokens = value.reshape(-1).tolist()
+        if self.verified_length is None:
+            # 첫 호출은 프롬프트 (+ 배치에서 넘어오기 전까지 생성한 토큰)
+            self.verified_length = len(tokens)
+            return
+        self.verified_length += len(tokens)
+        self.rounds += 1
+        # 확정 토큰 중 마지막 하나는 대상 모델이 직접 고른 토큰이고 나머지는 수락된 초안 토큰
+        self.proposed += self._candidate_tokens
+        self.accepted += min(max(len(tokens) - 1, 0), self._candidate_tokens)
+        self._candidate_tokens = 0
+
+        request = self.request
+        request.record_step(1)
+        for token in tokens:
+            if self._finished:
+                break
+            request.generated_ids.append(token)
+            self._finished = token in self.eos_token_ids
+        if request.on_text is not None:
+            self.scheduler._stream(request)
+
+    def end(self):
+        pass
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.verified_length is not None and input_ids.shape[-1] > self.verified_length:
+            self._candidate_tokens = input_ids.shape[-1] - self.verified_length
+        stop = self.request.cancelled or self.scheduler._has_waiting()
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+
+class BatchScheduler:
+    """진행 중인 요청들을 공유 forward pass로 묶어 처리하는 연속 배칭 스케줄러
+
+    대기열의 요청은 디코딩 스텝 사이에 prefill되어 배치에 합류하고,
+    종료 토큰이나 max_new_tokens에 도달한 요청은 즉시 배치에서 빠진다.
+
+    대화형 요청은 일괄 요청보다 먼저 배치에 들어가며, 배치 자리 중 interactive_slots개는
+    일괄 요청이 차지하지 못하게 비워 두어 긴 생성이 가득 차 있어도 바로 합류할 수 있다.
+    max_bulk_wait초 넘게 기다린 일괄 요청은 대화형 요청보다 먼저 들어가 굶지 않는다.
+
+    assistant_model(같은 토크나이저를 쓰는 작은 초안 모델)을 주면, 배치에 혼자 남는 생성 요청은
+    초안 모델이 제안한 토큰을 한 번에 검증하는 assisted generation으로 처리하고,
+    다른 요청이 들어오면 그때까지의 토큰을 유지한 채 일반 배치로 넘긴다.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, max_prefill_batch_size=32, prefix_cache=None,
+                 interactive_slots=1, max_bulk_wait=30.0, assistant_model=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = model.device
+        self.max_batch_size = max_batch_size
+        self.max_prefill_batch_size = max_prefill_batch_size
+        self.prefix_cache = prefix_cache
+        self.interactive_slots = min(interactive_slots, max_batch_size - 1)
+        self.max_bulk_wait = max_bulk_wait
+        self.assistant_model = assistant_model
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.eos_token_ids = collect_eos_token_ids(model, tokenizer)
+
+        self._cond = threading.Condition()
+        self._waiting = {priority: deque() for priority in PRIORITIES}
+        # 한 토큰만 필요한 요청(채점)은 디코딩 배치에 남지 않으므로 따로 모아 prefill 배치로 처리
+        self._waiting_prefill = deque()
+        self._running = False
+        self._thread = None
+
+        # 현재 배치 상태 (행 순서는 self._active와 동일)
+        self._active = []
+        self._past = None
+        self._attention_mask = None
+        self._next_tokens = None
+        # 대기열에서 꺼냈지만 아직 배치에 합류하지 않은 (prefill 중인) 요청
+        self._in_flight = []
+        # 배치 대신 초안 모델과 함께 혼자 생성 중인 요청
+        self._assisted = None
+
+        # 누적 통계
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_steps = 0
+        self.total_step_rows = 0
+        self.total_new_tokens = 0
+        self.total_queue_wait = 0.0
+        # prefill/디코딩 처리량 (처리한 토큰 수와 걸린 시간)
+        self.prefill_tokens = 0
+        self.prefill_seconds = 0.0
+        self.decode_tokens = 0
+        self.decode_seconds = 0.0
+        # assisted generation 통계 (검증 라운드 수, 생성 토큰 수, 초안 모델이 실제로 제안한 토큰 수와 그중 수락된 수)
+        self.assisted_requests = 0
+        self.assisted_rounds = 0
+        self.assisted_tokens = 0
+        self.assisted_proposed = 0
+        self.assisted_accepted = 0
+        self.assisted_seconds = 0.0
+        self.latency = LatencyStats()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def submit(self, request):
+        """요청을 대기열에 추가"""
+        self.submit_many([request])
+
+    def submit_many(self, requests):
+        """여러 요청을 한 번에 대기열에 추가하여 같은 prefill 배치로 묶이게 함"""
+        submitted_at = time.perf_counter()
+        with self._cond:
+            for request in requests:
+                request.submitted_at = submitted_at
+                if request.max_new_tokens == 1:
+                    self._waiting_prefill.append(request)
+                else:
+                    self._waiting[request.priority].append(request)
+            self._cond.notify()
+
+    async def run(self, request):
+        """요청을 대기열에 넣고 생성이 끝날 때까지 기다림"""
+        return (await self.run_many([request]))[0]
+
+    async def run_many(self, requests):
+        """여러 요청을 함께 제출하고 모두 끝날 때까지 기다림"""
+        loop = asyncio.get_running_loop()
+        for request in requests:
+            request._loop = loop
+            request._future = loop.create_future()
+        self.submit_many(requests)
+        try:
+            return await asyncio.gather(*(request._future for request in requests))
+        except asyncio.CancelledError:
+            # 기다리던 쪽이 취소되면 생성도 중단하여 배치 자리를 비움
+            submitted = {id(request) for request in requests}
+            self.cancel(lambda r: id(r) in submitted)
+            # 어느 목록에도 없는 순간(워커가 옮기는 중)이어도 워커가 플래그를 보고 제거함
+            for request in requests:
+                request.cancelled = True
+            raise
+
+    def cancel(self, predicate):
+        """조건에 맞는 요청을 취소하고 취소한 요청 수를 반환
+
+        대기 중인 요청은 즉시 대기열에서 빠지고, 배치에서 생성 중인 요청은
+        워커가 다음 디코딩 스텝 전에, assisted generation 중인 요청은 다음 검증 라운드 뒤에 멈춘다.
+        """
+        with self._cond:
+            queues = [*self._waiting.values(), self._waiting_prefill]
+            candidates = [request for queue in queues for request in queue] + self._in_flight + self._active
+            if self._assisted is not None:
+                candidates.append(self._assisted)
+            # prefill을 마친 요청은 _in_flight와 _active에 동시에 있을 수 있음
+            candidates = list(dict.fromkeys(candidates))
+            matched = [r for r in candidates if not r.cancelled and r.finished_at is None and predicate(r)]
+            for request in matched:
+                request.cancelled = True
+                for queue in queues:
+                    if request in queue:
+                        queue.remove(request)
+                        self._finish(request, "cancelled", GenerationCancelledError("생성이 중단되었습니다."))
+            self._cond.notify()
+        return len(matched)
+
+    def stats(self):
+        with self._cond:
+            waiting = {priority: len(queue) for priority, queue in self._waiting.items()}
+            waiting_prefill = len(self._waiting_prefill)
+        return {
+            "waiting": sum(waiting.values()) + waiting_prefill,
+            "waiting_by_priority": waiting,
+            "waiting_prefill": waiting_prefill,
+            "active": len(self._active),
+            "max_batch_size": self.max_batch_size,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "steps": self.total_steps,
+            "mean_batch_size": round(self.total_step_rows / self.total_steps, 2) if self.total_steps else 0,
+            "mean_queue_wait_ms": round(self.total_queue_wait / self.completed * 1000, 1) if self.completed else 0,
+            "new_tokens": self.total_new_tokens,
+            "prefill_tokens": self.prefill_tokens,
+            "prefill_seconds": round(self.prefill_seconds, 3),
+            "decode_tokens": self.decode_tokens,
+            "decode_seconds": round(self.decode_seconds, 3),
+            "priorities": self.latency.stats(),
+            "assisted": self.assisted_stats(),
+        }
+
+    def assisted_stats(self):
+        """초안 토큰 수락률과 검증 라운드당 토큰 수, 처리량"""
+        if self.assistant_model is None:
+            return None
+        return {
+            "requests": self.assisted_requests,
+            "rounds": self.assisted_rounds,
+            "tokens": self.assisted_tokens,
+            "seconds": round(self.assisted_seconds, 3),
+            "proposed": self.assisted_proposed,
+            "accepted": self.assisted_accepted,
+            "acceptance_rate": round(self.assisted_accepted / self.assisted_proposed, 3) if self.assisted_proposed else 0,
+            "tokens_per_round": round(self.assisted_tokens / self.assisted_rounds, 2) if self.assisted_rounds else 0,
+            "tokens_per_second": round(self.assisted_tokens / self.assisted_seconds, 1) if self.assisted_seconds else 0,
+        }
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._running and not self._has_waiting() and not self._active:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                admitted = self._take_waiting()
+                self._in_flight = admitted
+
+            try:
+                # 대기열에서 꺼낸 뒤 취소된 요청은 prefill하지 않음
+                pending = []
+                for request in admitted:
+                    if request.cancelled:
+                        self._finish(request, "cancelled", GenerationCancelledError("생성이 중단되었습니다."))
+                    else:
+                        pending.append(request)
+                admitted = pending
+                with torch.inference_mode():
+                    if self._use_assistant(admitted):
+                        if self._generate_assisted(admitted[0]):
+                            continue
+                    if admitted:
+                        self._admit(admitted)
+                    self._drop_cancelled()
+                    if self._active:
+                        self._decode_step()
+            except Exception as e:
+                print(f"스케줄러 처리 중 오류 발생: {e}")
+                for request in admitted + self._active:
+                    if request.finished_at is None:
+                        self._finish(request, "error", e)
+                self._reset_batch()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            finally:
+                with self._cond:
+                    self._in_flight = []
+
+    def _has_waiting(self):
+        return bool(self._waiting_prefill) or any(self._waiting.values())
+
+    def _take_waiting(self):
+        """배치의 빈 자리만큼 대기 요청을 우선순위 순서로 꺼냄 (호출 시 self._cond 보유)"""
+        admitted = []
+        while self._waiting_prefill and len(admitted) < self.max_prefill_batch_size:
+            admitted.append(self._waiting_prefill.popleft())
+
+        interactive = self._waiting[PRIORITY_INTERACTIVE]
+        bulk = self._waiting[PRIORITY_BULK]
+        bulk_running = sum(1 for request in self._active if request.priority == PRIORITY_BULK)
+        free_slots = self.max_batch_size - len(self._active)
+        now = time.perf_counter()
+        while free_slots > 0:
+            bulk_ready = bulk and bulk_running < self.max_batch_size - self.interactive_slots
+            aged = bulk_ready and now - bulk[0].submitted_at >= self.max_bulk_wait
+            if interactive and not aged:
+                admitted.append(interactive.popleft())
+            elif bulk_ready:
+                admitted.append(bulk.popleft())
+                bulk_running += 1
+            else:
+                break
+            free_slots -= 1
+        return admitted
+
+    def _use_assistant(self, admitted):
+        """혼자 처리하게 될 생성 요청인지 (초안 모델은 배치 크기 1에서만 이득)"""
+        if self.assistant_model is None or self._active or len(admitted) != 1 or self._has_waiting():
+            return False
+        request = admitted[0]
+        return request.max_new_tokens > 1 and request.allowed_token_ids is None and request.token_filter is None
+
+    def _generate_assisted(self, request):
+        """초안 모델과 함께 생성하고, 끝났으면 True를 반환 (다른 요청이 들어와 멈췄으면 False)"""
+        from transformers import StoppingCriteriaList
+
+        if request.cancelled:
+            self._finish(request, "cancelled", GenerationCancelledError("생성이 중단되었습니다."))
+            return True
+        request.started_at = request.started_at or time.perf_counter()
+        started_at = time.perf_counter()
+        sequence = request.input_ids + request.generated_ids
+        generated_before = len(request.generated_ids)
+        input_ids = torch.tensor([sequence], dtype=torch.long, device=self.device)
+        progress = AssistedProgress(self, request, self.eos_token_ids)
+        sampling = dict(temperature=request.temperature, top_p=request.top_p, top_k=request.top_k) if request.do_sample else {}
+        # cancel()이 이 요청도 찾을 수 있도록 생성 중인 동안 기록
+        with self._cond:
+            self._assisted = request
+        try:
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                assistant_model=self.assistant_model,
+                max_new_tokens=request.max_new_tokens - generated_before,
+                do_sample=request.do_sample,
+                repetition_penalty=request.repetition_penalty,
+                eos_token_id=sorted(self.eos_token_ids),
+                pad_token_id=self.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([progress]),
+                streamer=progress,
+                **sampling
+            )
+        finally:
+            with self._cond:
+                self._assisted = None
+        request.generated_ids = request.generated_ids[:generated_before] + output[0, len(sequence):].tolist()
+        for i, token in enumerate(request.generated_ids):
+            if token in self.eos_token_ids:
+                del request.generated_ids[i + 1:]
+                break
+
+        tokens = len(request.generated_ids) - generated_before
+        self.assisted_requests += 1
+        self.assisted_rounds += progress.rounds
+        self.assisted_tokens += tokens
+        self.assisted_proposed += progress.proposed
+        self.assisted_accepted += progress.accepted
+        self.assisted_seconds += time.perf_counter() - started_at
+
+        if request.generated_ids and request.generated_ids[-1] in self.eos_token_ids:
+            self._finish(request, "stop")
+        elif len(request.generated_ids) >= request.max_new_tokens:
+            self._finish(request, "length")
+        elif request.cancelled:
+            self._finish(request, "cancelled", GenerationCancelledError("생성이 중단되었습니다."))
+        else:
+            print(f"assisted generation 중단: 다른 요청이 들어와 토큰 {len(request.generated_ids)}개 생성 후 배치로 전환")
+            return False
+        return True
+
+    def _drop_cancelled(self):
+        """취소된 요청을 배치에서 제거하여 다음 스텝부터 자리를 비움"""
+        keep = [i for i, request in enumerate(self._active) if not request.cancelled]
+        if len(keep) == len(self._active):
+            return
+        for request in self._active:
+            if request.cancelled:
+                self._finish(request, "cancelled", GenerationCancelledError("생성이 중단되었습니다."))
+        self._retain(keep)
+
+    def _admit(self, requests):
+        """새 요청들을 prefill하고 첫 토큰을 뽑은 뒤 현재 배치에 합류시킴"""
+        started_at = time.perf_counter()
+        for request in requests:
+            request.started_at = request.started_at or started_at
+
+        # 같은 prefix가 캐시된 요청끼리는 나머지 구간만 묶어 prefill하고, 캐시가 없는 요청은 한 배치로 prefill
+        uncached = []
+        cached_groups = {}
+        for request in requests:
+            prefix_len, prefix_past = 0, None
+            if self.prefix_cache is not None and request.cache_prefix_len:
+                prefix_len, prefix_past = self.prefix_cache.lookup(request.input_ids)
+            if prefix_past is None:
+                uncached.append(request)
+                continue
+            request.cached_tokens = prefix_len
+            group_key = (prefix_len, hash(tuple(request.input_ids[:prefix_len])))
+            cached_groups.setdefault(group_key, (prefix_len, prefix_past, []))[2].append(request)
+
+        for prefix_len, prefix_past, group in cached_groups.values():
+            self._join(group, *self._prefill_cached(group, prefix_len, prefix_past))
+        if uncached:
+            self._join(uncached, *self._prefill(uncached))
+        self.prefill_tokens += sum(len(request.input_ids) + len(request.generated_ids) - request.cached_tokens for request in requests)
+        self.prefill_seconds += time.perf_counter() - started_at
+
+    def _join(self, requests, past, attention_mask, logits):
+        """prefill을 마친 요청들의 첫 토큰을 뽑고 진행 중인 배치와 합침"""
+        self._store_prefixes(requests, past, attention_mask)
+        keep, next_tokens = self._advance(requests, logits)
+        if not keep:
+            return
+
+        index = torch.tensor(keep, device=attention_mask.device)
+        requests = [requests[i] for i in keep]
+        past = select_cache_rows(past, index)
+        attention_mask = attention_mask.index_select(0, index)
+        next_tokens = next_tokens.index_select(0, index)
+
+        if not self._active:
+            self._active, self._past, self._attention_mask, self._next_tokens = requests, past, attention_mask, next_tokens
+            return
+
+        length = max(self._attention_mask.shape[1], attention_mask.shape[1])
+        self._past, self._attention_mask = left_pad_cache(self._past, self._attention_mask, length)
+        past, attention_mask = left_pad_cache(past, attention_mask, length)
+        self._past = tuple(
+            (torch.cat([k, new_k]), torch.cat([v, new_v]))
+            for (k, v), (new_k, new_v) in zip(self._past, past)
+        )
+        self._attention_mask = torch.cat([self._attention_mask, attention_mask])
+        self._next_tokens = torch.cat([self._next_tokens, next_tokens])
+        self._active.extend(requests)
+
+    def _store_prefixes(self, requests, past, attention_mask):
+        """prefill 결과에서 각 요청의 시스템 프롬프트 구간 KV 상태를 prefix 캐시에 저장"""
+        if self.prefix_cache is None:
+            return
+        for i, request in enumerate(requests):
+            length = self.prefix_cache.aligned_length(request.cache_prefix_len)
+            token_ids = request.input_ids[:length]
+            if not length or self.prefix_cache.contains(token_ids):
+                continue
+            # 패딩 위치를 건너뛰고 실제 토큰 위치의 KV만 복사
+            positions = attention_mask[i].nonzero().squeeze(-1)[:length]
+            self.prefix_cache.store(
+                token_ids,
+                tuple((k[i:i + 1].index_select(2, positions), v[i:i + 1].index_select(2, positions)) for k, v in past)
+            )
+
+    def _left_pad(self, sequences):
+        """토큰 id 목록들을 왼쪽 패딩한 (input_ids, attention_mask) 텐서로 변환"""
+        length = max(len(sequence) for sequence in sequences)
+        input_ids = torch.full((len(sequences), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), length), dtype=torch.long)
+        for i, sequence in enumerate(sequences):
+            input_ids[i, length - len(sequence):] = torch.tensor(sequence, dtype=torch.long)
+            attention_mask[i, length - len(sequence):] = 1
+        return input_ids.to(self.device), attention_mask.to(self.device)
+
+    def _prefill(self, requests):
+        """새 요청들을 왼쪽 패딩한 하나의 배치로 prefill"""
+        # assisted generation에서 넘어온 요청은 이미 생성한 토큰까지 함께 prefill
+        input_ids, attention_mask = self._left_pad([request.input_ids + request.generated_ids for request in requests])
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        logits, past = self._forward(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids)
+        return past, attention_mask, logits
+
+    def _prefill_cached(self, requests, prefix_len, prefix_past):
+        """캐시된 공통 prefix KV 상태 뒤에 이어지는 구간만 한 배치로 prefill
+
+        각 행은 [prefix][패딩][나머지 구간] 형태가 되며, 패딩은 어텐션 마스크로 가려진다.
+        """
+        input_ids, suffix_mask = self._left_pad([(request.input_ids + request.generated_ids)[prefix_len:] for request in requests])
+        prefix_mask = suffix_mask.new_ones((len(requests), prefix_len))
+        attention_mask = torch.cat([prefix_mask, suffix_mask], dim=-1)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, prefix_len:]
+        past = tuple(
+            (k.expand(len(requests), -1, -1, -1), v.expand(len(requests), -1, -1, -1)) for k, v in prefix_past
+        )
+        logits, past = self._forward(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=to_model_cache(past),
+        )
+        return past, attention_mask, logits
+
+    def _decode_step(self):
+        """배치 전체에 대해 한 토큰씩 디코딩"""
+        started_at = time.perf_counter()
+        batch_size = len(self._active)
+        ones = self._attention_mask.new_ones((len(self._active), 1))
+        self._attention_mask = torch.cat([self._attention_mask, ones], dim=-1)
+        position_ids = self._attention_mask.sum(-1, keepdim=True) - 1
+        logits, self._past = self._forward(
+            input_ids=self._next_tokens.unsqueeze(-1),
+            attention_mask=self._attention_mask,
+            position_ids=position_ids,
+            past_key_values=to_model_cache(self._past),
+        )
+        keep, self._next_tokens = self._advance(self._active, logits)
+        self._retain(keep)
+        self.decode_tokens += batch_size
+        self.decode_seconds += time.perf_counter() - started_at
+
+    def _forward(self, **kwargs):
+        """마지막 위치의 logits만 계산하여 prefill 메모리를 절약"""
+        base_model = getattr(self.model, "model", None)
+        lm_head = getattr(self.model, "lm_head", None)
+        if base_model is None or lm_head is None:
+            outputs = self.model(use_cache=True, **kwargs)
+            return outputs.logits[:, -1, :].float(), to_legacy_cache(outputs.past_key_values)
+        outputs = base_model(use_cache=True, **kwargs)
+        logits = lm_head(outputs.last_hidden_state[:, -1, :]).float()
+        return logits, to_legacy_cache(outputs.past_key_values)
+
+    def _advance(self, requests, logits):
+        """각 행의 다음 토큰을 뽑고, 계속 진행할 행의 인덱스와 토큰을 반환"""
+        batch_size = len(requests)
+        tokens = []
+        keep = []
+        for i, (request, row_logits) in enumerate(zip(requests, logits)):
+            token = self._sample(request, row_logits)
+            request.generated_ids.append(token)
+            request.record_step(batch_size)
+            tokens.append(token)
+            if request.on_text is not None:
+                self._stream(request)
+
+            if token in self.eos_token_ids:
+                self._finish(request, "stop")
+            elif len(request.generated_ids) >= request.max_new_tokens:
+                self._finish(request, "length")
+            else:
+                keep.append(i)
+
+        self.total_steps += 1
+        self.total_step_rows += batch_size
+        return keep, torch.tensor(tokens, dtype=torch.long, device=logits.device)
+
+    def _retain(self, keep):
+        """종료된 행을 배치에서 제거하고 모든 행이 패딩인 앞쪽 열을 잘라냄"""
+        if len(keep) == len(self._active):
+            return
+        if not keep:
+            self._reset_batch()
+            return
+
+        index = torch.tensor(keep, device=self._attention_mask.device)
+        self._active = [self._active[i] for i in keep]
+        self._past = select_cache_rows(self._past, index)
+        self._attention_mask = self._attention_mask.index_select(0, index)
+        self._next_tokens = self._next_tokens.index_select(0, index)
+
+        first = int(self._attention_mask.sum(0).nonzero()[0])
+        if first > 0:
+            self._past = tuple((k[:, :, first:], v[:, :, first:]) for k, v in self._past)
+            self._attention_mask = self._attention_mask[:, first:]
+
+    def _reset_batch(self):
+        self._active = []
+        self._past = None
+        self._attention_mask = None
+        self._next_tokens = None
+
+    def _sample(self, request, logits):
+        """요청별 샘플링 설정(temperature, top-k, top-p, 반복 패널티)으로 다음 토큰 선택"""
+        if request.allowed_token_ids is not None:
+            index = torch.tensor(request.allowed_token_ids, dtype=torch.long, device=logits.device)
+            allowed_logits = logits[index]
+            if request.token_scores is None:
+                probs = allowed_logits.softmax(-1).tolist()
+                request.token_scores = dict(zip(request.allowed_token_ids, probs))
+            logits = torch.full_like(logits, float("-inf")).index_copy(0, index, allowed_logits)
+        elif request.token_filter is not None:
+            allowed = request.token_filter(request.input_ids + request.generated_ids)
+            if allowed:
+                index = torch.tensor(allowed, dtype=torch.long, device=logits.device)
+                logits = torch.full_like(logits, float("-inf")).index_copy(0, index, logits[index])
+
+        if request.repetition_penalty != 1.0:
+            seen = self._seen_token_tensor(request, logits.device)
+            scores = logits[seen]
+            logits[seen] = torch.where(scores < 0, scores * request.repetition_penalty, scores / request.repetition_penalty)
+
+        if not request.do_sample:
+            return int(torch.argmax(logits))
+
+        logits = logits / request.temperature
+        if request.top_k > 0:
+            kth_value = torch.topk(logits, min(request.top_k, logits.shape[-1])).values[-1]
+            logits = logits.masked_fill(logits < kth_value, float("-inf"))
+        if request.top_p < 1.0:
+            sorted_logits, sorted_index = torch.sort(logits, descending=True)
+            sorted_probs = sorted_logits.softmax(-1)
+            # 누적 확률이 top_p를 넘기 전의 토큰까지만 남김 (최소 1개 유지)
+            remove = sorted_probs.cumsum(-1) - sorted_probs > request.top_p
+            sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+            logits = torch.full_like(logits, float("-inf")).scatter(0, sorted_index, sorted_logits)
+        return int(torch.multinomial(logits.softmax(-1), 1))
+
+    def _seen_token_tensor(self, request, device):
+        """반복 패널티 대상 토큰(프롬프트 + 생성 토큰) id 텐서"""
+        if request._seen_ids is None:
+            request._seen_ids = set(request.input_ids) | set(request.generated_ids)
+            request._seen_tensor = torch.tensor(sorted(request._seen_ids), dtype=torch.long, device=device)
+        for token in request.generated_ids[-1:]:
+            if token not in request._seen_ids:
+                request._seen_ids.add(token)
+                request._seen_tensor = torch.cat([request._seen_tensor, request._seen_tensor.new_tensor([token])])
+        return request._seen_tensor
+
+    def _stream(self, request, final=False):
+        """마지막으로 전달한 위치 이후의 텍스트만 디코딩하여 on_text로 전달"""
+        text = self.tokenizer.decode(request.generated_ids[request._stream_token_offset:], skip_special_tokens=True)
+        if text.endswith("\ufffd") and not final:
+            # 멀티바이트 문자가 아직 완성되지 않음
+            return
+        delta = text[request._stream_text_offset:]
+        if text.endswith("\n"):
+            # 줄 단위로 디코딩 구간을 초기화하여 매 스텝 전체를 다시 디코딩하지 않음
+            request._stream_token_offset = len(request.generated_ids)
+            request._stream_text_offset = 0
+        else:
+            request._stream_text_offset = len(text)
+        if delta:
+            request.on_text(delta)
+
+    def _finish(self, request, reason, error=None):
+        if request.on_text is not None and error is None:
+            self._stream(request, final=True)
+        request.finish_reason = reason
+        request.error = error
+        request.finished_at = time.perf_counter()
+        if isinstance(error, GenerationCancelledError):
+            self.cancelled += 1
+            print(f"생성 중단: 토큰 {len(request.generated_ids)}개 생성 후 취소됨")
+        elif error is None:
+            self.completed += 1
+            self.total_new_tokens += len(request.generated_ids)
+            self.total_queue_wait += request.queue_wait
+            self.latency.record(request)
+            stats = request.stats()
+            print(
+                f"생성 완료({request.priority}): 대기 {stats['queue_wait_ms']}ms, 평균 배치 {stats['mean_batch_size']}, "
+                f"최대 배치 {stats['max_batch_size']}, 토큰 {stats['new_tokens']}개 ({reason})"
+            )
+        else:
+            self.failed += 1
+        if request._future is not None:
+            request._loop.call_soon_threadsafe(_resolve_future, request._future, request, error)
@@ -0,0 +1,102 @@
+# structured_output.py
+import importlib.util
+import threading
+
+# 문제 유형별 JSON 스키마 (프론트엔드 text_processing.parse_structured_response가 읽는 형식)
+QUESTION_SCHEMAS = {
+    "multiple-choice": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string", "minLength": 1, "maxLength": 600},
+            "options": {
+                "type": "array",
+                "items": {"type": "string", "minLength": 1, "maxLength": 200},
+                "minItems": 4,
+                "maxItems": 4,
+            },
+            "answer": {"type": "string", "enum": ["a", "b", "c", "d"]},
+            "explanation": {"type": "string", "maxLength": 400},
+        },
+        "required": ["question", "options", "answer", "explanation"],
+    },
+    "short answer": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string", "minLength": 1, "maxLength": 600},
+            "answer": {"type": "string", "minLength": 1, "maxLength": 60},
+            "explanation": {"type": "string", "maxLength": 400},
+        },
+        "required": ["question", "answer", "explanation"],
+    },
+    "true/false": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string", "minLength": 1, "maxLength": 600},
+            "answer": {"type": "string", "enum": ["참", "거짓"]},
+            "explanation": {"type": "string", "maxLength": 400},
+        },
+        "required": ["question", "answer", "explanation"],
+    },
+    "fill-in-the-blank": {
+        "type": "object",
+        "properties": {
+            # 프론트엔드 후처리가 버리지 않도록 빈칸(밑줄 3개 이상)을 반드시 포함
+            "question": {"type": "string", "minLength": 1, "maxLength": 600, "pattern": "[\\s\\S]*___[\\s\\S]*"},
+            "answer": {"type": "string", "minLength": 1, "maxLength": 60},
+            "explanation": {"type": "string", "maxLength": 400},
+        },
+        "required": ["question", "answer", "explanation"],
+    },
+}
+
+
+def question_response_schema(expected_output):
+    """유형별 문제 수만큼의 문제 배열을 담은 JSON 객체 스키마 ({"multiple-choice": [...], ...})"""
+    properties = {}
+    for question_type, count in expected_output.items():
+        if count <= 0 or question_type not in QUESTION_SCHEMAS:
+            continue
+        properties[question_type] = {
+            "type": "array",
+            "items": QUESTION_SCHEMAS[question_type],
+            "minItems": count,
+            "maxItems": count,
+        }
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+class JsonSchemaConstraint:
+    """lm-format-enforcer로 디코딩 스텝마다 JSON 스키마를 벗어나지 않는 토큰만 허용
+
+    토크나이저 어휘 분석은 시간이 걸리므로 prepare()에서 모델 로드 스레드가 한 번만 수행하고,
+    요청마다 만드는 token_filter는 (프롬프트 + 생성 토큰) 목록을 받아 허용 토큰 id 목록을 반환한다.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self._tokenizer_data = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("lmformatenforcer") is not None
+
+    def prepare(self):
+        from lmformatenforcer.integrations.transformers import build_token_enforcer_tokenizer_data
+
+        with self._lock:
+            if self._tokenizer_data is None:
+                self._tokenizer_data = build_token_enforcer_tokenizer_data(self.tokenizer)
+        return self
+
+    def token_filter(self, schema):
+        from lmformatenforcer import JsonSchemaParser, TokenEnforcer
+
+        enforcer = TokenEnforcer(self.prepare()._tokenizer_data, JsonSchemaParser(schema))
+
+        def allowed_tokens(token_ids):
+            allowed = enforcer.get_allowed_tokens(token_ids)
+            # 버전에 따라 id 목록 또는 allowed_tokens 속성을 가진 객체를 반환
+            return getattr(allowed, "allowed_tokens", allowed)
+
+        return allowed_tokens
@@ -0,0 +1,227 @@
+# backend_pool.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+# 모델 서버 주소 목록 (쉼표로 구분)
+MODEL_SERVER_URLS = [url.strip().rstrip("/") for url in os.environ.get("MODEL_SERVER_URLS", "http://localhost:8000").split(",") if url.strip()]
+
+# 연속 실패 몇 번에 서버를 목록에서 빼고, 상태 확인을 몇 초마다 할지
+MAX_CONSECUTIVE_FAILURES = int(os.environ.get("MAX_CONSECUTIVE_FAILURES", "3"))
+HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", "10"))
+HEALTH_CHECK_TIMEOUT = 3
+
+# 모든 서버가 429(대기열 가득 참)로 거절할 때 다시 시도하는 횟수와 한 번에 기다리는 최대 시간 (초)
+MAX_RETRY_ATTEMPTS = 5
+MAX_RETRY_WAIT = 30
+
+
+def _not_sent(error):
+    """서버에 연결하지 못해 요청이 전달되지 않은 오류인지 (다른 서버로 보내도 중복 실행되지 않음)"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def _rewind_files(kwargs):
+    """다시 보내는 요청의 업로드 파일을 처음부터 읽도록 되돌림"""
+    for file in (kwargs.get("files") or {}).values():
+        if hasattr(file, "seek"):
+            file.seek(0)
+
+
+class Backend:
+    """모델 서버 하나의 상태 (처리 중인 요청 수, 연속 실패 수, 제외 여부)"""
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        self.requests = 0
+        self.errors = 0
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class BackendPool:
+    """여러 모델 서버에 요청을 나눠 보내는 클라이언트
+
+    요청마다 처리 중인 요청이 가장 적은 정상 서버를 고르고, 연속으로 실패하거나 /health/ready가 실패한 서버는
+    상태 확인 스레드가 다시 준비됐다고 확인할 때까지 제외한다.
+    idempotent 요청은 실패하면 다른 서버로 다시 보내고, 그 밖의 요청은 서버에 전달되지 않았거나
+    서버가 처리 전에 거절(429, 503)한 경우에만 다른 서버로 보낸다.
+    """
+
+    def __init__(self, urls, max_failures=MAX_CONSECUTIVE_FAILURES, health_check_interval=HEALTH_CHECK_INTERVAL):
+        if not urls:
+            raise ValueError("모델 서버 주소가 하나 이상 필요합니다.")
+        self.backends = [Backend(url) for url in urls]
+        self.max_failures = max_failures
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._pinned = {}  # 작업 id -> 작업을 제출한 서버
+        self._health_thread = None
+
+    def pick(self, exclude=()):
+        """처리 중인 요청이 가장 적은 정상 서버 (남은 서버가 모두 제외되었으면 제외된 서버 중에서 고름)"""
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend not in exclude]
+            candidates = [backend for backend in candidates if backend.healthy] or candidates
+            return min(candidates, key=lambda backend: (backend.outstanding, backend.requests))
+
+    def pin(self, job_id, backend):
+        """작업 상태 조회와 중단 요청이 작업을 제출한 서버로 가도록 기록 (작업이 끝날 때까지 처리 중인 요청으로 셈)"""
+        with self._lock:
+            self._pinned[job_id] = backend
+            backend.outstanding += 1
+
+    def pinned(self, job_id):
+        with self._lock:
+            return self._pinned.get(job_id)
+
+    def unpin(self, job_id):
+        with self._lock:
+            backend = self._pinned.pop(job_id, None)
+            if backend is not None:
+                backend.outstanding -= 1
+
+    @contextmanager
+    def hold(self, backend):
+        """스트리밍 응답을 읽는 동안 서버를 처리 중으로 셈"""
+        with self._lock:
+            backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+
+    def request(self, method, path, idempotent=False, backend=None, max_attempts=MAX_RETRY_ATTEMPTS, **kwargs):
+        """
+        요청을 보내고 (응답한 서버, 응답)을 반환
+        :param backend: 지정하면 그 서버로만 보냄 (작업 상태 조회 등)
+        :return: 마지막 응답 (모든 서버가 429로 거절하고 재시도를 모두 쓰면 429 응답 그대로)
+        """
+        self._start_health_checks()
+        for attempt in range(1, max_attempts + 1):
+            tried = []
+            retry_after = []
+            while True:
+                target = backend or self.pick(exclude=tried)
+                tried.append(target)
+                _rewind_files(kwargs)
+                try:
+                    response = self._send(target, method, path, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    if backend is not None or not (idempotent or _not_sent(e)) or len(tried) == len(self.backends):
+                        raise
+                    print(f"Model server {target.url} failed ({e}), trying another server")
+                    continue
+
+                if response.status_code == 429:
+                    retry_after.append(response.headers.get("Retry-After", ""))
+                retryable = response.status_code in (429, 503) or (idempotent and response.status_code >= 500)
+                if not retryable or backend is not None or len(tried) == len(self.backends):
+                    break
+                response.close()
+
+            if response.status_code != 429 or attempt == max_attempts:
+                return tried[-1], response
+            # 모든 서버의 대기열이 가득 참: 가장 먼저 자리가 날 서버의 Retry-After만큼 기다림
+            waits = [int(value) for value in retry_after if value.isdigit()]
+            wait = min(min(waits) if waits else 2 ** attempt, MAX_RETRY_WAIT)
+            print(f"Model servers are busy, retrying in {wait}s ({attempt}/{max_attempts - 1})")
+            response.close()
+            time.sleep(wait)
+
+    def post(self, path, idempotent=False, **kwargs):
+        return self.request("POST", path, idempotent=idempotent, **kwargs)[1]
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, idempotent=True, **kwargs)[1]
+
+    def broadcast(self, method, path, **kwargs):
+        """모든 서버에 같은 요청을 보내고 {서버 주소: 응답 또는 오류}를 반환 (긴급 중단, 통계 조회)"""
+        results = {}
+        for backend in self.backends:
+            try:
+                results[backend.url] = self._send(backend, method, path, **kwargs)
+            except requests.exceptions.RequestException as e:
+                results[backend.url] = e
+        return results
+
+    def stats(self):
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+    def _send(self, backend, method, path, **kwargs):
+        with self._lock:
+            backend.outstanding += 1
+            backend.requests += 1
+        try:
+            response = requests.request(method, f"{backend.url}{path}", **kwargs)
+        except requests.exceptions.RequestException:
+            self._record_failure(backend)
+            raise
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+        if response.status_code < 500:
+            with self._lock:
+                backend.failures = 0
+                backend.healthy = True
+        elif response.status_code != 503:
+            # 503은 모델 로딩 중인 정상 서버의 응답이므로 실패로 세지 않음
+            self._record_failure(backend)
+        return response
+
+    def _record_failure(self, backend):
+        with self._lock:
+            backend.errors += 1
+            backend.failures += 1
+            if backend.healthy and backend.failures >= self.max_failures:
+                backend.healthy = False
+                print(f"Model server {backend.url} ejected after {backend.failures} consecutive failures")
+
+    def _start_health_checks(self):
+        if len(self.backends) < 2 or self.health_check_interval <= 0:
+            return
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(target=self._health_check_loop, name="backend-health", daemon=True)
+            self._health_thread.start()
+
+    def _health_check_loop(self):
+        while True:
+            for backend in self.backends:
+                try:
+                    ready = requests.get(f"{backend.url}/health/ready", timeout=HEALTH_CHECK_TIMEOUT).status_code == 200
+                except requests.exceptions.RequestException:
+                    ready = False
+                with self._lock:
+                    if ready and not backend.healthy:
+                        print(f"Model server {backend.url} is ready again")
+                    elif not ready and backend.healthy:
+                        print(f"Model server {backend.url} is not ready, ejected")
+                    backend.healthy = ready
+                    if ready:
+                        backend.failures = 0
+            time.sleep(self.health_check_interval)
+
+
+# 프론트엔드 전체가 공유하는 서버 목록
+pool = BackendPool(MODEL_SERVER_URLS)
@@ -0,0 +1,177 @@
+# benchmark.py
+"""
+문제 생성 흐름 전체(검색 → 생성 요청 → 응답 파싱)에 대한 부하 테스트
+
+GPU 없이 실행하려면 백엔드를 모의 엔진으로 띄운 뒤 실행한다:
+    INFERENCE_ENGINE=mock python backend.py
+    EMBEDDING_DEVICE=cpu python benchmark.py load --clients 8 --requests 32
+
+엔진별 토큰 처리량 비교 (예: GPU 4bit 서버와 CPU int8 서버):
+    python benchmark.py tokens --servers http://gpu-node:8000 http://cpu-node:8000 --concurrency 1 4
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from backend_pool import pool
+from question_generation import generate_questions_batch
+
+SAMPLE_DOCUMENT = (
+    "운영체제는 하드웨어 자원을 관리하고 응용 프로그램에 서비스를 제공하는 소프트웨어이다. "
+    "프로세스는 실행 중인 프로그램으로 코드, 데이터, 스택 영역으로 구성된 독립된 메모리 공간을 가진다. "
+    "스레드는 프로세스 안에서 실행되는 흐름의 단위이며 같은 프로세스의 스레드는 메모리를 공유한다. "
+    "CPU 스케줄러는 준비 큐에 있는 프로세스 중 하나를 선택하여 CPU를 할당한다. "
+    "교착 상태는 둘 이상의 프로세스가 서로가 가진 자원을 기다리며 무한히 대기하는 상태이다."
+)
+
+
+def run_once(index, question_counts):
+    """문제 생성 한 번을 실행하고 (소요 시간, 파싱된 문제 수)를 반환"""
+    subtopic_question_types = {f"벤치마크 {index}": dict(question_counts)}
+    started_at = time.perf_counter()
+    all_questions, _, _ = generate_questions_batch([SAMPLE_DOCUMENT], subtopic_question_types, max_retries=1)
+    elapsed = time.perf_counter() - started_at
+    parsed = sum(len(questions) for by_type in all_questions.values() for questions in by_type.values())
+    return elapsed, parsed
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def load_test(args):
+    question_counts = {
+        "multiple-choice": args.multiple_choice,
+        "short answer": args.short_answer,
+        "true/false": args.true_false,
+        "fill-in-the-blank": args.fill_in_the_blank,
+    }
+    question_counts = {qt: count for qt, count in question_counts.items() if count > 0}
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(lambda i: run_once(i, question_counts), range(args.requests)))
+    wall_time = time.perf_counter() - started_at
+
+    latencies = [elapsed for elapsed, _ in results]
+    parsed = sum(count for _, count in results)
+    print(f"요청 {args.requests}개 (동시 {args.clients}개), 전체 {wall_time:.1f}초")
+    print(f"처리량: {args.requests / wall_time:.2f} 요청/초, {parsed / wall_time:.1f} 문제/초")
+    print(
+        f"지연 시간: 평균 {statistics.mean(latencies):.2f}초, p50 {percentile(latencies, 0.5):.2f}초, "
+        f"p95 {percentile(latencies, 0.95):.2f}초, 최대 {max(latencies):.2f}초"
+    )
+    print(f"파싱된 문제: {parsed}개 (요청당 평균 {parsed / args.requests:.1f}개)")
+
+    print("서버별 요청 분배:", pool.stats())
+    for url, response in pool.broadcast("GET", "/stats", timeout=10).items():
+        try:
+            if isinstance(response, Exception):
+                raise response
+            print(f"서버 통계 ({url}):", response.json())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"서버 통계를 가져오지 못했습니다 ({url}): {e}")
+
+
+def server_stats(url):
+    return requests.get(f"{url}/stats", timeout=10).json()
+
+
+def generate_once(url, index, max_new_tokens):
+    """캐시를 건너뛰고 /generate를 한 번 호출하여 (생성 토큰 수, 걸린 시간)을 반환"""
+    payload = {
+        "prompt": "다음 글을 읽고 핵심 개념을 설명하는 단답형 문제를 만드세요.",
+        "context": f"[{index}] {SAMPLE_DOCUMENT}",
+        "max_new_tokens": max_new_tokens,
+        "no_cache": True,
+    }
+    started_at = time.perf_counter()
+    response = requests.post(f"{url}/generate", json=payload, timeout=3600)
+    response.raise_for_status()
+    return response.json()["new_tokens"], time.perf_counter() - started_at
+
+
+def token_benchmark(args):
+    """서버(엔진)별로 동시 요청 수를 바꿔 가며 prefill/디코딩 토큰 처리량을 측정"""
+    rows = []
+    for url in args.servers:
+        url = url.rstrip("/")
+        engine = server_stats(url)["models"]["engine"]
+        # 측정 전 워밍업 한 번
+        generate_once(url, -1, 8)
+        for concurrency in args.concurrency:
+            before = server_stats(url)["scheduler"]
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(lambda i: generate_once(url, i, args.max_new_tokens), range(args.requests)))
+            wall_time = time.perf_counter() - started_at
+            after = server_stats(url)["scheduler"]
+
+            def rate(key):
+                seconds = after[f"{key}_seconds"] - before[f"{key}_seconds"]
+                return (after[f"{key}_tokens"] - before[f"{key}_tokens"]) / seconds if seconds else 0.0
+
+            # 초안 모델을 쓰는 서버는 혼자 처리한 요청의 assisted generation 처리량과 수락률도 기록
+            assisted = None
+            if after.get("assisted"):
+                seconds = after["assisted"]["seconds"] - before["assisted"]["seconds"]
+                tokens = after["assisted"]["tokens"] - before["assisted"]["tokens"]
+                assisted = (tokens / seconds if seconds else 0.0, after["assisted"]["acceptance_rate"])
+
+            rows.append({
+                "server": url,
+                "engine": engine,
+                "concurrency": concurrency,
+                "tokens_per_second": sum(tokens for tokens, _ in results) / wall_time,
+                "prefill_tokens_per_second": rate("prefill"),
+                "decode_tokens_per_second": rate("decode"),
+                "p50_latency": percentile([elapsed for _, elapsed in results], 0.5),
+                "assisted": assisted,
+            })
+
+    print(f"{'서버':<32} {'엔진':<12} {'동시':>4} {'전체 tok/s':>10} {'prefill tok/s':>13} {'decode tok/s':>12} {'p50(초)':>8}")
+    for row in rows:
+        print(
+            f"{row['server']:<32} {row['engine']:<12} {row['concurrency']:>4} {row['tokens_per_second']:>10.1f} "
+            f"{row['prefill_tokens_per_second']:>13.1f} {row['decode_tokens_per_second']:>12.1f} {row['p50_latency']:>8.2f}"
+        )
+        if row["assisted"]:
+            print(f"  assisted generation: {row['assisted'][0]:.1f} tok/s, 초안 토큰 수락률 {row['assisted'][1]:.1%}")
+    # 첫 번째 서버를 기준으로 같은 동시 요청 수끼리 비교
+    reference = {row["concurrency"]: row for row in rows if row["server"] == args.servers[0].rstrip("/")}
+    for row in rows:
+        base = reference.get(row["concurrency"])
+        if base is not None and row is not base and base["tokens_per_second"]:
+            print(f"{row['server']} (동시 {row['concurrency']}): 기준 대비 {row['tokens_per_second'] / base['tokens_per_second']:.2f}배")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="모델 서버 부하 테스트")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    load = subparsers.add_parser("load", help="generate_questions_batch를 동시에 여러 번 실행")
+    load.add_argument("--clients", type=int, default=4, help="동시에 요청하는 클라이언트 수")
+    load.add_argument("--requests", type=int, default=16, help="전체 요청 수")
+    load.add_argument("--multiple-choice", type=int, default=3)
+    load.add_argument("--short-answer", type=int, default=2)
+    load.add_argument("--true-false", type=int, default=2)
+    load.add_argument("--fill-in-the-blank", type=int, default=2)
+    load.set_defaults(func=load_test)
+
+    tokens = subparsers.add_parser("tokens", help="서버(엔진)별 토큰 처리량 비교 (첫 번째 서버가 기준)")
+    tokens.add_argument("--servers", nargs="+", required=True, help="비교할 모델 서버 주소")
+    tokens.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="동시 요청 수 (여러 개 지정 가능)")
+    tokens.add_argument("--requests", type=int, default=8, help="동시 요청 수마다 보낼 요청 수")
+    tokens.add_argument("--max-new-tokens", type=int, default=128)
+    tokens.set_defaults(func=token_benchmark)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# context_packer.py
+import os
+import re
+import threading
+
+# 모델 서버와 같은 토크나이저로 컨텍스트 토큰 수를 셈 (비우거나 로드에 실패하면 글자 수로 추정)
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "Qwen/Qwen2-7B-Instruct")
+# 검색 결과로 채우는 컨텍스트 최대 토큰 수
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "4096"))
+# 남은 예산이 이보다 작으면 다음 청크를 잘라 넣지 않음
+MIN_TRIMMED_TOKENS = 64
+# 토크나이저가 없을 때 한 토큰에 해당한다고 보는 글자 수 (한국어 기준 보수적인 값)
+CHARS_PER_TOKEN = 1.5
+
+# 문장 끝 (마침표, 물음표, 느낌표, 줄바꿈 뒤)
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+class TokenCounter:
+    """토크나이저를 처음 쓸 때 한 번만 로드하여 프로세스 전체가 공유하는 토큰 계수기"""
+
+    def __init__(self, tokenizer_id):
+        self.tokenizer_id = tokenizer_id
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return self._tokenizer
+            if self.tokenizer_id:
+                try:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_id)
+                except Exception as e:
+                    print(f"토크나이저 {self.tokenizer_id}를 로드하지 못해 글자 수로 토큰 수를 추정합니다: {e}")
+            self._loaded = True
+            return self._tokenizer
+
+    def count(self, text):
+        tokenizer = self._load()
+        if tokenizer is None:
+            return int(len(text) / CHARS_PER_TOKEN) + 1
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def trim_to_sentences(text, max_tokens, counter):
+    """max_tokens 안에 들어가는 앞쪽 문장들만 남김 (한 문장도 들어가지 않으면 빈 문자열)"""
+    sentences = [sentence for sentence in SENTENCE_END_PATTERN.split(text) if sentence.strip()]
+    kept = []
+    used = 0
+    for sentence in sentences:
+        tokens = counter.count(sentence + " ")
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def pack_context(chunks, max_tokens=CONTEXT_MAX_TOKENS, counter=None):
+    """
+    관련도 순으로 정렬된 청크를 토큰 예산 안에서 앞에서부터 채워 컨텍스트 문자열을 만듦
+    :param chunks: 관련도가 높은 순서의 텍스트 청크 리스트
+    :return: (컨텍스트, 통계 딕셔너리)
+    """
+    counter = counter or token_counter
+    packed = []
+    used = 0
+    dropped = 0
+    trimmed = 0
+    for chunk in chunks:
+        tokens = counter.count(chunk + "\n")
+        remaining = max_tokens - used
+        if tokens <= remaining:
+            packed.append(chunk)
+            used += tokens
+            continue
+        # 예산을 넘는 청크는 문장 단위로 잘라 남은 자리만 채움
+        partial = trim_to_sentences(chunk, remaining, counter) if remaining >= MIN_TRIMMED_TOKENS else ""
+        if partial:
+            partial_tokens = counter.count(partial + "\n")
+            packed.append(partial)
+            used += partial_tokens
+            dropped += tokens - partial_tokens
+            trimmed += 1
+        else:
+            dropped += tokens
+
+    stats = {"chunks": len(chunks), "packed": len(packed), "trimmed": trimmed, "tokens": used, "dropped_tokens": dropped, "budget": max_tokens}
+    if dropped:
+        print(f"컨텍스트 예산 {max_tokens}토큰 초과: 청크 {len(chunks)}개 중 {len(packed)}개 사용 ({trimmed}개 문장 단위로 자름), 버린 토큰 {dropped}개")
+    return "\n".join(packed), stats
+
+
+# 프론트엔드 전체가 공유하는 토큰 계수기
+token_counter = TokenCounter(CONTEXT_TOKENIZER)
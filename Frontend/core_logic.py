@@ -7,7 +7,7 @@ from file_handlers import load_documents
 from question_generation import emergency_stop, transcribe_video_file, transcribe_audio_file, generate_questions_batch
 import database
 from database import *
-from utils import create_csv, check_answer
+from utils import create_csv, check_answer, check_answers_batch
 import langchain
 import pandas as pd
 import numpy as np
@@ -133,10 +133,11 @@ def create_questions(subject, subtopics_data):
             subtopic_file.name = "".join([c for c in subtopic_file.name if c.isalnum() or c in ['_', '-', '.']]).rstrip()
 
             if file_extension in ['mp4', 'mp3', 'wav', "m4a"]:
+                on_progress = show_job_progress(f"{subtopic_name} 음성 변환 중...")
                 if file_extension == 'mp4':
-                    extracted_text = transcribe_video_file(f"tmp/{subtopic_file.name}")
+                    extracted_text = transcribe_video_file(f"tmp/{subtopic_file.name}", on_progress=on_progress, user_id=st.session_state.get('user_id'))
                 else:
-                    extracted_text = transcribe_audio_file(f"tmp/{subtopic_file.name}")
+                    extracted_text = transcribe_audio_file(f"tmp/{subtopic_file.name}", on_progress=on_progress, user_id=st.session_state.get('user_id'))
 
                 if extracted_text:
                     docs = [langchain.schema.Document(page_content=extracted_text)]
@@ -150,7 +151,9 @@ def create_questions(subject, subtopics_data):
                     increased_question_types = {qt: int(num * 1.5) for qt, num in subtopic_question_types.items()}
                     all_questions, all_answers, additional_questions = generate_questions_batch(
                         docs=docs,
-                        subtopic_question_types={subtopic_name: increased_question_types}
+                        subtopic_question_types={subtopic_name: increased_question_types},
+                        on_partial=show_generation_preview(subtopic_name),
+                        user_id=st.session_state.get('user_id')
                     )
 
                     st.session_state.questions[subtopic_name] = {}
@@ -180,6 +183,22 @@ def create_questions(subject, subtopics_data):
     else:
         return "문제 생성 결과가 없습니다. 다시 시도해 주세요."
 
+def show_job_progress(label):
+    """서버 작업의 진행률을 진행 막대로 보여주는 콜백 생성"""
+    progress_bar = st.progress(0.0, text=label)
+
+    def update(progress, partial_output):
+        progress_bar.progress(min(max(progress, 0.0), 1.0), text=label)
+    return update
+
+def show_generation_preview(subtopic_name):
+    """서버에서 받는 생성 중간 결과를 화면에 미리 보여주는 콜백 생성"""
+    placeholder = st.empty()
+
+    def update(partial_response):
+        placeholder.text_area(f"{subtopic_name} 생성 중...", partial_response[-3000:], height=300)
+    return update
+
 def save_questions_to_database(user_id, subject, subtopic_name):
     for qt, questions in st.session_state.questions[subtopic_name].items():
         answers = st.session_state.answers[subtopic_name][qt]
@@ -337,10 +356,11 @@ def create_personal_questions(user_id, subject, subtopics_data):
             subtopic_file.name = "".join([c for c in subtopic_file.name if c.isalnum() or c in ['_', '-', '.']]).rstrip()
 
             if file_extension in ['mp4', 'mp3', 'wav', "m4a"]:
+                on_progress = show_job_progress(f"{subtopic_name} 음성 변환 중...")
                 if file_extension == 'mp4':
-                    extracted_text = transcribe_video_file(f"tmp/{subtopic_file.name}")
+                    extracted_text = transcribe_video_file(f"tmp/{subtopic_file.name}", on_progress=on_progress, user_id=user_id)
                 else:
-                    extracted_text = transcribe_audio_file(f"tmp/{subtopic_file.name}")
+                    extracted_text = transcribe_audio_file(f"tmp/{subtopic_file.name}", on_progress=on_progress, user_id=user_id)
 
                 if extracted_text:
                     st.session_state.extracted_text[subtopic_name] = extracted_text
@@ -355,7 +375,9 @@ def create_personal_questions(user_id, subject, subtopics_data):
                     increased_question_types = {qt: int(num * 1.5) for qt, num in subtopic_question_types.items()}
                     all_questions, all_answers, additional_questions = generate_questions_batch(
                         docs=docs,
-                        subtopic_question_types={subtopic_name: increased_question_types}
+                        subtopic_question_types={subtopic_name: increased_question_types},
+                        on_partial=show_generation_preview(subtopic_name),
+                        user_id=user_id
                     )
 
                     st.session_state.personal_questions[subtopic_name] = {}
@@ -420,14 +442,22 @@ def grade_personal_questions(user_id, user_answers):
     total_questions = 0
     results = []
 
+    # 모든 문항을 한 번의 요청으로 채점
+    answer_triples = []
     for subtopic_name, question_types in st.session_state.personal_questions.items():
         for qt, questions in question_types.items():
             for i, question in enumerate(questions):
-                total_questions += 1
                 correct_answer = st.session_state.personal_answers[subtopic_name][qt][i].split('\n')[0].split(':')[1].strip()
-                user_answer = user_answers.get(total_questions)
+                answer_triples.append((user_answers.get(len(answer_triples) + 1), correct_answer, qt))
+    grades = check_answers_batch(answer_triples, user_id)
 
-                is_correct = check_answer(user_answer, correct_answer, qt)
+    for subtopic_name, question_types in st.session_state.personal_questions.items():
+        for qt, questions in question_types.items():
+            for i, question in enumerate(questions):
+                total_questions += 1
+                user_answer, correct_answer, _ = answer_triples[total_questions - 1]
+
+                is_correct = grades[total_questions - 1]
                 if is_correct:
                     correct_count += 1
 
@@ -739,4 +769,9 @@ def show_personal_grading_results():
         st.warning("채점할 문제가 없습니다.")
 
 def stop_generate():
-    print(emergency_stop())
\ No newline at end of file
+    # 현재 사용자가 제출한 생성/변환 작업만 중단 (사용자 정보가 없으면 다른 사용자 작업까지 멈추지 않도록 보내지 않음)
+    user_id = st.session_state.get('user_id')
+    if user_id is None:
+        st.warning("로그인 정보가 없어 생성을 중단할 수 없습니다.")
+        return
+    print(emergency_stop(user_id=user_id))
\ No newline at end of file
@@ -4,7 +4,7 @@ import json
 from datetime import datetime
 import uuid
 from collections import Counter
-from utils import check_answer
+from utils import check_answers_batch
 import streamlit as st
 
 # 데이터베이스 연결 설정
@@ -622,7 +622,8 @@ def get_user_answers(user_id, room_id):
         answers = cursor.fetchall()
         
         total_questions = len(answers)
-        correct_answers = sum(1 for answer in answers if check_answer(answer['answer'], answer['answer_text'], answer['question_type']))
+        grades = check_answers_batch([(answer['answer'], answer['answer_text'], answer['question_type']) for answer in answers], user_id)
+        correct_answers = sum(1 for is_correct in grades if is_correct)
         score = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
         
         return {
@@ -1107,7 +1108,8 @@ def get_question_info_and_stats(room_id, question_id):
         answers = cursor.fetchall()
 
         total_answers = len(answers)
-        correct_answers = sum(1 for answer in answers if check_answer(answer['answer'], question_info['answer_text'], question_info['question_type']))
+        grades = check_answers_batch([(answer['answer'], question_info['answer_text'], question_info['question_type']) for answer in answers])
+        correct_answers = sum(1 for is_correct in grades if is_correct)
 
         return {
             'question_text': question_info['question_text'],
@@ -1147,7 +1149,8 @@ def get_most_frequent_incorrect_answer(room_id, question_id):
         question_type = answers[0]['question_type']
 
         # 정답이 아닌 응답 필터링
-        incorrect_answers = [a['answer'] for a in answers if not check_answer(a['answer'], correct_answer, question_type)]
+        grades = check_answers_batch([(a['answer'], correct_answer, question_type) for a in answers])
+        incorrect_answers = [a['answer'] for a, is_correct in zip(answers, grades) if not is_correct]
 
         if not incorrect_answers:
             return "없다"  # 모든 답안이 정답인 경우
@@ -1,52 +1,128 @@
 import io
+import os
 import csv
+import json
 import math
 import re
+import time
 import requests
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from text_processing import separate_questions_and_answers  # 이 부분은 필요에 따라 경로 조정
+from text_processing import separate_questions_and_answers, parse_structured_response  # 이 부분은 필요에 따라 경로 조정
 from database import save_questions_to_db  # 필요에 따라 경로 조정
 from langchain.schema import Document
 import random
 from typing import List, Dict
+from backend_pool import pool
+from context_packer import pack_context
 
-BASE_URL = "localhost:8000"
-API_URL = f"http://{BASE_URL}/generate"
-CVF_URL = f"http://{BASE_URL}/transcribe_video"
-CAF_URL = f"http://{BASE_URL}/transcribe_audio"
-EST_URL = f"http://{BASE_URL}/emergency_stop"
+# 모델 서버 경로 (서버 목록은 backend_pool.MODEL_SERVER_URLS)
+API_PATH = "/generate"
+STREAM_PATH = "/generate_stream"
+CVF_PATH = "/transcribe_video"
+CAF_PATH = "/transcribe_audio"
+EST_PATH = "/emergency_stop"
+JOBS_PATH = "/jobs"
+
+# 생성 요청 방식: "job"(제출 후 상태 조회) 또는 "stream"(SSE 스트리밍)
+GENERATION_MODE = os.environ.get("GENERATION_MODE", "job")
+
+# 1이면 문제를 JSON으로 요청하고 모델 서버가 유형별 JSON 스키마로 디코딩을 제약 (0이면 기존 텍스트 형식)
+STRUCTURED_OUTPUT = os.environ.get("STRUCTURED_OUTPUT", "1") == "1"
+
+# 스트리밍 요청 타임아웃 (연결, 토큰 사이 최대 대기) 초
+STREAM_TIMEOUT = (10, 300)
+
+# 작업 제출/조회 요청 타임아웃과 상태 조회 간격 (초)
+JOB_REQUEST_TIMEOUT = (10, 60)
+JOB_POLL_INTERVAL = 1.0
+
+class JobFailedError(Exception):
+    """서버 작업이 실패하거나 취소된 경우"""
 
 # FastAPI 클라이언트 요청 함수 추가
 
-def emergency_stop():
+def emergency_stop(job_id=None, user_id=None, stop_all=False):
+    """작업 하나(job_id) 또는 사용자의 모든 작업(user_id)을 중단. 모든 사용자의 생성 중단은 stop_all=True로만 (관리자용)"""
+    if job_id is None and user_id is None and not stop_all:
+        print("중단할 작업이나 사용자가 지정되지 않아 긴급 중단 요청을 보내지 않습니다.")
+        return None
+    payload = {key: value for key, value in {"job_id": job_id, "user_id": user_id}.items() if value is not None}
+    if stop_all:
+        payload["all"] = True
     try:
-        response = requests.post(EST_URL)
-        response.raise_for_status()
-        return response.text
+        backend = pool.pinned(job_id) if job_id is not None else None
+        if backend is not None:
+            response = pool.post(EST_PATH, backend=backend, json=payload)
+            response.raise_for_status()
+            return response.text
+        # 사용자 단위나 전체 중단은 모든 모델 서버에 보냄
+        results = []
+        for url, response in pool.broadcast("POST", EST_PATH, json=payload).items():
+            if isinstance(response, Exception):
+                print(f"Error occurred while requesting model: {response}")
+                continue
+            response.raise_for_status()
+            results.append(f"{url}: {response.text}")
+        return "\n".join(results) if results else None
     except requests.exceptions.RequestException as e:
         print(f"Error occurred while requesting model: {e}")
         return None
 
-def transcribe_video_file(video_file_path):
+def submit_job(kind, **kwargs):
+    """비동기 작업을 제출하고 작업 id를 반환 (이후 조회는 작업을 받은 서버로 감)"""
+    backend, response = pool.request("POST", f"{JOBS_PATH}/{kind}", timeout=JOB_REQUEST_TIMEOUT, **kwargs)
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    pool.pin(job_id, backend)
+    return job_id
+
+def job_owner(user_id):
+    """업로드 작업에 함께 보낼 사용자 정보 (중단 요청 시 사용)"""
+    return {"user_id": str(user_id)} if user_id is not None else None
+
+def wait_for_job(job_id, on_progress=None, poll_interval=JOB_POLL_INTERVAL):
+    """작업이 끝날 때까지 상태를 조회하고 결과를 반환 (on_progress에는 진행률과 부분 결과 전달)"""
+    partial_output = ""
+    backend = pool.pinned(job_id)
+    try:
+        while True:
+            response = pool.get(f"{JOBS_PATH}/{job_id}", backend=backend, params={"offset": len(partial_output)}, timeout=JOB_REQUEST_TIMEOUT)
+            response.raise_for_status()
+            status = response.json()
+            partial_output += status["partial_output"]
+            if on_progress:
+                on_progress(status["progress"], partial_output)
+
+            if status["status"] == "succeeded":
+                response = pool.get(f"{JOBS_PATH}/{job_id}/result", backend=backend, timeout=JOB_REQUEST_TIMEOUT)
+                response.raise_for_status()
+                return response.json()["result"]
+            if status["status"] in ("failed", "cancelled"):
+                raise JobFailedError(f"Job {job_id} {status['status']}: {status.get('error')}")
+            time.sleep(poll_interval)
+    finally:
+        pool.unpin(job_id)
+
+def transcribe_video_file(video_file_path, on_progress=None, user_id=None):
     """비디오 파일을 서버에 업로드하여 텍스트를 추출하는 함수"""
-    with open(video_file_path, "rb") as video_file:
-        response = requests.post(CVF_URL, files={"file": video_file})
-        if response.status_code == 200:
-            return response.text
-        else:
-            raise Exception(f"Error during transcription: {response.status_code} - {response.text}")
+    try:
+        with open(video_file_path, "rb") as video_file:
+            job_id = submit_job("transcribe_video", files={"file": video_file}, data=job_owner(user_id))
+        return wait_for_job(job_id, on_progress=on_progress)
+    except (requests.exceptions.RequestException, JobFailedError) as e:
+        raise Exception(f"Error during transcription: {e}")
 
-def transcribe_audio_file(audio_file_path):
+def transcribe_audio_file(audio_file_path, on_progress=None, user_id=None):
     """오디오 파일을 서버에 업로드하여 텍스트를 추출하는 함수"""
-    with open(audio_file_path, "rb") as audio_file:
-        response = requests.post(CAF_URL, files={"file": audio_file})
-        if response.status_code == 200:
-            return response.text
-        else:
-            raise Exception(f"Error during transcription: {response.status_code} - {response.text}")
+    try:
+        with open(audio_file_path, "rb") as audio_file:
+            job_id = submit_job("transcribe_audio", files={"file": audio_file}, data=job_owner(user_id))
+        return wait_for_job(job_id, on_progress=on_progress)
+    except (requests.exceptions.RequestException, JobFailedError) as e:
+        raise Exception(f"Error during transcription: {e}")
 
-def generate_questions_batch(docs, subtopic_question_types, batch_size=8, max_retries=6):
+def generate_questions_batch(docs, subtopic_question_types, batch_size=8, max_retries=6, on_partial=None, user_id=None):
     try:
         if isinstance(docs, str):
             docs = [Document(page_content=docs)]
@@ -54,7 +130,7 @@ def generate_questions_batch(docs, subtopic_question_types, batch_size=8, max_re
             docs = [Document(page_content=doc) for doc in docs]
 
         EMBEDDING_MODEL = 'text2vec'
-        EMBEDDING_DEVICE = "cuda"
+        EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "cuda")  # GPU가 없는 환경에서는 cpu
         VECTOR_SEARCH_TOP_K = 8
         embedding_model_dict = {
             "text2vec": "Alibaba-NLP/gte-multilingual-base"
@@ -89,16 +165,28 @@ def generate_questions_batch(docs, subtopic_question_types, batch_size=8, max_re
                         continue
 
                     # 현재 코드에서 사용되는 외부 함수 호출
-                    query = create_enhanced_question_prompt(question_types, remaining_questions)
+                    query = create_enhanced_question_prompt(question_types, remaining_questions, structured=STRUCTURED_OUTPUT)
                     retriever = docsearch.as_retriever(search_kwargs={"k": min(VECTOR_SEARCH_TOP_K, len(group))})
                     relevant_docs = retriever.get_relevant_documents(query)
-                    context = "\n".join([doc.page_content for doc in relevant_docs])
-
-                    response = send_request_to_model_server(context, query)
+                    # 관련도 순으로 토큰 예산(CONTEXT_MAX_TOKENS)만큼만 채움
+                    context, _ = pack_context([doc.page_content for doc in relevant_docs])
+
+                    # 재시도에서는 이전과 다른 결과가 필요하므로 응답 캐시를 사용하지 않음
+                    response = send_request_to_model_server(
+                        context,
+                        query,
+                        on_partial=on_partial,
+                        no_cache=try_count > 0,
+                        user_id=user_id,
+                        expected_output=remaining_questions,
+                        structured=STRUCTURED_OUTPUT
+                    )
                     print(f"API Response: {response}")
 
                     if response:
-                        questions, answers = separate_questions_and_answers(response, question_types)
+                        parsed = parse_structured_response(response, question_types) if STRUCTURED_OUTPUT else None
+                        # JSON으로 읽지 못한 응답(잘린 출력 등)은 기존 텍스트 형식 파서로 시도
+                        questions, answers = parsed or separate_questions_and_answers(response, question_types)
                         processed_questions, processed_answers = post_process_questions(questions, answers, question_types)
 
                         for qt in question_types:
@@ -115,6 +203,14 @@ def generate_questions_batch(docs, subtopic_question_types, batch_size=8, max_re
 
             try_count += 1
 
+            # 모든 주제의 문제가 채워졌으면 남은 재시도를 돌지 않음
+            if all(
+                len(all_questions[subtopic][qt]) >= subtopic_question_types[subtopic][qt] + 5
+                for subtopic in subtopic_question_types for qt in subtopic_question_types[subtopic]
+            ):
+                print(f"{try_count}번째 시도에서 모든 문제 생성이 완료되었습니다.")
+                break
+
         # 최종 결과 로깅
         for subtopic, question_types in subtopic_question_types.items():
             for qt in question_types:
@@ -127,35 +223,40 @@ def generate_questions_batch(docs, subtopic_question_types, batch_size=8, max_re
         print(f"Error in generate_questions_batch: {str(e)}")
         raise
 
-def create_enhanced_question_prompt(question_types, num_questions):
+def create_enhanced_question_prompt(question_types, num_questions, structured=False):
+    # 요청마다 달라지는 문제 수는 마지막에 두어, 앞쪽 지침 구간을 백엔드 prefix 캐시가 재사용하도록 함
+    if structured:
+        return write_prompt_log(create_structured_question_prompt(question_types, num_questions))
     prompt = f"""
 Generate questions and answers in Korean based on the given text for multiple question types.
 Adhere strictly to the following guidelines:
 
-1. Create EXACTLY the following number of questions for each type:
-{' '.join([f'- {qt}: {num_questions[qt]}' for qt in question_types])}
+1. Each question must be directly and solely based on the provided text content.
+2. Do not invent, assume, or infer any additional information or context that is not explicitly present in the provided text.
+3. Ensure that all questions are unique and non-repetitive across all types.
+4. Do not include any question numbering or 'Question:', '[Question]' prefix.
+5. If the given text contains content related to programming languages, include coding-related questions where appropriate.
+6. Use clear and concise language.
+7. Ensure all text is in Korean, including code comments.
+8. Every questions and answers should separated never combine questions or answers.
 
-2. Each question must be directly and solely based on the provided text content.
-3. Do not invent, assume, or infer any additional information or context that is not explicitly present in the provided text.
-4. Ensure that all questions are unique and non-repetitive across all types.
-5. Do not include any question numbering or 'Question:', '[Question]' prefix.
-6. If the given text contains content related to programming languages, include coding-related questions where appropriate.
-7. Use clear and concise language.
-8. Ensure all text is in Korean, including code comments.
-9. Every questions and answers should separated never combine questions or answers.
-
-10. **STRICTLY** use the following format for each question type:
+9. **STRICTLY** use the following format for each question type:
 
 {''.join([f'''
 [{qt.upper()}]
 {get_question_format(qt)}
 ''' for qt in question_types])}
 
-11. Label each question clearly with its type (e.g., [MULTIPLE-CHOICE], [SHORT ANSWER], [TRUE/FALSE], [FILL-IN-THE-BLANK]).
+10. Label each question clearly with its type (e.g., [MULTIPLE-CHOICE], [SHORT ANSWER], [TRUE/FALSE], [FILL-IN-THE-BLANK]).
+
+11. Create EXACTLY the following number of questions for each type:
+{' '.join([f'- {qt}: {num_questions[qt]}' for qt in question_types])}
 
 **IMPORTANT:** It is **CRUCIAL** to generate **EXACTLY** the specified number of questions for **EACH** type. Double-check your output before returning it.
 """
+    return write_prompt_log(prompt)
 
+def write_prompt_log(prompt):
     f = "prompt_log"
     with open(f, "w", encoding="utf-8") as file:
         file.write(prompt)
@@ -163,15 +264,97 @@ Adhere strictly to the following guidelines:
         file.write("\n")
     return prompt
 
-def send_request_to_model_server(context, query):
+def create_structured_question_prompt(question_types, num_questions):
+    """문제를 유형별 JSON 배열로 요청하는 프롬프트 (형식은 모델 서버의 JSON 스키마 제약이 보장)"""
+    prompt = f"""
+Generate questions and answers in Korean based on the given text for multiple question types.
+Adhere strictly to the following guidelines:
+
+1. Each question must be directly and solely based on the provided text content.
+2. Do not invent, assume, or infer any additional information or context that is not explicitly present in the provided text.
+3. Ensure that all questions are unique and non-repetitive across all types.
+4. Do not include any question numbering or 'Question:', '[Question]' prefix.
+5. If the given text contains content related to programming languages, include coding-related questions where appropriate.
+6. Use clear and concise language.
+7. Ensure all text is in Korean, including code comments.
+
+8. Respond with a single JSON object only. Each key is a question type and each value is an array of questions:
+
+{{"multiple-choice": [{{"question": "...", "options": ["...", "...", "...", "..."], "answer": "a", "explanation": "..."}}],
+ "short answer": [{{"question": "...", "answer": "...", "explanation": "..."}}],
+ "true/false": [{{"question": "...", "answer": "참", "explanation": "..."}}],
+ "fill-in-the-blank": [{{"question": "... _____ ...", "answer": "...", "explanation": "..."}}]}}
+
+9. Type-specific rules:
+    - multiple-choice: exactly 4 options without 'a)' prefixes, and "answer" is the letter (a, b, c or d) of the correct option.
+    - short answer: the answer is 1-5 words long.
+    - true/false: the answer is either '참' or '거짓'.
+    - fill-in-the-blank: replace exactly one key term in the question with '_____' and do not include the answer in the question.
+
+10. Include only these question types, with EXACTLY the following number of questions for each type:
+{' '.join([f'- {qt}: {num_questions[qt]}' for qt in question_types if num_questions[qt] > 0])}
+"""
+    return prompt
+
+def send_request_to_model_server(context, query, on_partial=None, no_cache=False, user_id=None, expected_output=None, structured=False):
+    """생성 작업을 제출하고 끝날 때까지 조회하여 응답을 반환 (on_partial에는 지금까지 생성된 텍스트 전달)
+
+    expected_output에 유형별 문제 수를 주면 백엔드가 그에 맞춰 생성 토큰 한도를 정하고,
+    structured면 같은 문제 수의 JSON 스키마에 맞게 디코딩한다.
+    """
+    payload = {
+        "prompt": query,
+        "context": context,
+        "no_cache": no_cache,
+        "user_id": user_id,
+        "expected_output": expected_output,
+        "response_format": "json" if structured else "text"
+    }
+    if GENERATION_MODE == "stream":
+        return stream_request_to_model_server(payload, on_partial)
+
+    try:
+        job_id = submit_job("generate", json=payload)
+        on_progress = (lambda progress, partial_output: on_partial(partial_output)) if on_partial else None
+        return wait_for_job(job_id, on_progress=on_progress).get("response")
+    except (requests.exceptions.RequestException, JobFailedError) as e:
+        print(f"Error occurred while requesting model: {e}")
+        return None
+
+def stream_request_to_model_server(payload, on_partial=None):
+    """생성 결과를 스트리밍으로 받아 전체 응답을 반환"""
     try:
-        response = requests.post(API_URL, json={"prompt": query, "context": context})
-        response.raise_for_status()
-        return response.json().get("response")
+        backend, response = pool.request("POST", STREAM_PATH, json=payload, stream=True, timeout=STREAM_TIMEOUT)
+        with pool.hold(backend), response:
+            response.raise_for_status()
+            chunks = []
+            for event, data in iter_sse_events(response):
+                if event == "error":
+                    print(f"Error occurred while generating: {data.get('detail')}")
+                    return None
+                if event == "done":
+                    print(f"Generation stats: {data}")
+                    break
+                chunks.append(data["text"])
+                if on_partial:
+                    on_partial("".join(chunks))
+            return "".join(chunks)
     except requests.exceptions.RequestException as e:
         print(f"Error occurred while requesting model: {e}")
         return None
 
+def iter_sse_events(response):
+    """Server-Sent Events 응답을 (이벤트 이름, JSON 데이터) 단위로 읽음"""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
 
 def get_question_format(question_type):
     formats = {
@@ -1,4 +1,5 @@
 # text_processing.py
+import json
 import re
 from langchain.text_splitter import TextSplitter
 
@@ -80,4 +81,43 @@ def separate_questions_and_answers(response, question_types):
         else:
             print(f"Warning: Unknown question type '{q_type}' detected.")
     
-    return questions, answers
\ No newline at end of file
+    return questions, answers
+
+
+def parse_structured_response(response, question_types):
+    """JSON 응답({"multiple-choice": [{"question", "options", "answer", "explanation"}], ...})을
+    separate_questions_and_answers와 같은 (questions, answers) 형식으로 변환 (JSON이 아니면 None)
+    """
+    start, end = response.find('{'), response.rfind('}')
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(response[start:end + 1])
+    except ValueError as e:
+        print(f"Warning: Could not parse JSON response: {e}")
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    questions = {qt: [] for qt in question_types}
+    answers = {qt: [] for qt in question_types}
+    for q_type, items in data.items():
+        if q_type not in question_types or not isinstance(items, list):
+            print(f"Warning: Unknown question type '{q_type}' detected.")
+            continue
+        for item in items:
+            if not isinstance(item, dict) or not item.get('question') or not item.get('answer'):
+                print(f"Warning: Incomplete '{q_type}' question in JSON response.")
+                continue
+            question = str(item['question']).strip()
+            answer = str(item['answer']).strip()
+            if q_type == 'multiple-choice':
+                # 선택지 앞에 모델이 붙인 "a)" 등은 떼고 다시 번호를 붙임
+                options = [re.sub(r'^\s*[a-dA-D][).]\s*', '', str(option)).strip() for option in item.get('options') or []]
+                question = '\n'.join([question] + [f"{letter}) {option}" for letter, option in zip('abcd', options)])
+                letter = answer[:1].lower()
+                if letter in ('a', 'b', 'c', 'd') and len(options) == 4:
+                    answer = f"{letter}) {options['abcd'.index(letter)]}"
+            questions[q_type].append(question)
+            answers[q_type].append(f"정답: {answer}\n해설: {str(item.get('explanation', '')).strip()}")
+    return questions, answers
@@ -3,9 +3,10 @@ import io
 import csv
 import requests
 from difflib import SequenceMatcher
+from backend_pool import pool
 
-BASE_URL = "localhost:8000"
-SMT_URL = f"http://{BASE_URL}/similarity"
+SMT_PATH = "/similarity"
+SMB_PATH = "/similarity_batch"
 
 def check_answer(user_answer, correct_answer, question_type):
     try:
@@ -19,7 +20,7 @@ def check_answer(user_answer, correct_answer, question_type):
             f"Correct answer: {correct_answer}\n"
             f"User's answer: {user_answer}\n"
         )
-        response = requests.post(SMT_URL, json={'prompt': prompt, 'context': context})
+        response = pool.post(SMT_PATH, idempotent=True, json={'prompt': prompt, 'context': context})
         response_data = response.json()
         
         if "response" not in response_data:
@@ -37,6 +38,36 @@ def check_answer(user_answer, correct_answer, question_type):
         print(f"Error in response structure: {ve}")
         return None
 
+def check_answers_batch(answer_triples, user_id=None):
+    """
+    여러 답안을 한 번의 요청으로 채점하는 함수
+    :param answer_triples: (user_answer, correct_answer, question_type) 튜플 리스트
+    :return: 각 답안의 정답 여부 리스트 (요청 실패 시 모두 None)
+    """
+    if not answer_triples:
+        return []
+    items = [
+        {
+            'user_answer': None if user_answer is None else str(user_answer),
+            'correct_answer': str(correct_answer),
+            'question_type': question_type
+        }
+        for user_answer, correct_answer, question_type in answer_triples
+    ]
+    try:
+        response = pool.post(SMB_PATH, idempotent=True, json={'items': items, 'user_id': user_id})
+        response.raise_for_status()
+        results = response.json().get("results")
+        if results is None or len(results) != len(items):
+            raise ValueError("Expected one result per item in the API response.")
+        return [result["response"].strip().lower() in ["true", "참", "정답"] for result in results]
+    except requests.exceptions.RequestException as e:
+        print(f"Error occurred while requesting model: {e}")
+        return [None] * len(answer_triples)
+    except ValueError as ve:
+        print(f"Error in response structure: {ve}")
+        return [None] * len(answer_triples)
+
 def create_csv(questions, answers, user_ratings):
     """
     문제, 답변, 사용자 평가를 CSV 파일로 만드는 함수